@@ -10,6 +10,7 @@ from src.config import settings
 from src.database import Base
 from src.auth.v1 import models as auth_models  # noqa
 from src.providers.v1 import models as sellers_models  # noqa
+from src.notifications.v1 import models as notifications_models  # noqa
 
 
 POSTGRES_URL = settings.POSTGRES_URL
@@ -0,0 +1,35 @@
+"""notification outbox nullable body
+
+Revision ID: 8b1e4d7a92c0
+Revises: 3f9a7c2d1e5b
+Create Date: 2025-06-20 09:41:07.512390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b1e4d7a92c0'
+down_revision: Union[str, None] = '3f9a7c2d1e5b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column('notification_outbox', 'body',
+               existing_type=sa.Text(),
+               nullable=True)
+    # Settled rows no longer keep the tokens and passwords they carried.
+    op.execute("UPDATE notification_outbox SET body = NULL WHERE status != 'PENDING'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("UPDATE notification_outbox SET body = '' WHERE body IS NULL")
+    op.alter_column('notification_outbox', 'body',
+               existing_type=sa.Text(),
+               nullable=False)
@@ -0,0 +1,457 @@
+"""
+Load test of the auth flows over HTTP.
+
+Every virtual user runs register -> activate -> login -> refresh ->
+change-password -> logout with a fresh identity, `--concurrency` of them at
+once until `--flows` flows ran. The app is driven in-process through its
+ASGI interface (`--server asgi`, no network) or through a uvicorn started on
+a free local port (`--server uvicorn`, `--workers` processes). Both run the
+app's lifespan, so Lua scripts are loaded before anything is measured.
+
+It runs against the Postgres and Redis of the environment (POSTGRES_URL,
+REDIS_URL), e.g. the test_db and test_redis containers; `--create-schema`
+creates the tables on an empty database. Login throttling is raised so the
+single client address isn't limited.
+
+Latencies are per step. DB and Redis calls per request come from the
+`/metrics` counters around the steps of one flow run alone after a warm-up
+flow, so they depend neither on the concurrency nor on cold caches. The
+JSON report carries the commit and the configuration, so reports of
+different commits can be diffed.
+
+Usage:
+    python -m benchmarks.auth_flows --server asgi --concurrency 20 --flows 500
+    python -m benchmarks.auth_flows --server uvicorn --workers 4 --output a.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from uuid import uuid4
+
+# Read by `AuthConfig`, so it must be set before `src` is imported.
+os.environ.setdefault("LOGIN_ATTEMPTS_PER_IP", "1000000000")
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from src.config import settings
+from src.database import Base
+from src.auth.v1.config import auth_config
+from src.auth.v1.repositories import get_user_id_by_identity_value
+from src.auth.v1.utils import encode_activation_token
+from src.auth.v1 import models as auth_models  # noqa
+from src.providers.v1 import models as providers_models  # noqa
+from src.notifications.v1 import models as notifications_models  # noqa
+
+STEPS = ("register", "activate", "login", "refresh", "change-password", "logout")
+_PASSWORD = "benchmark-password"
+_NEW_PASSWORD = "benchmark-password-2"
+
+
+class StepFailed(Exception):
+    pass
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = {step: [] for step in STEPS}
+        self.errors: dict[str, Counter[str]] = {step: Counter() for step in STEPS}
+
+    async def request(
+        self,
+        client: httpx.AsyncClient,
+        step: str,
+        expected_status: int,
+        method: str,
+        url: str,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as ex:
+            self.errors[step][type(ex).__name__] += 1
+            raise StepFailed from ex
+        self.latencies[step].append(time.perf_counter() - start)
+        # Cookies are passed explicitly: the client is shared by many users.
+        client.cookies.clear()
+        if response.status_code != expected_status:
+            self.errors[step][str(response.status_code)] += 1
+            raise StepFailed
+        return response
+
+
+async def _activation_token(
+    session_maker: async_sessionmaker[AsyncSession], identity_value: str
+) -> str:
+    # On an engine of its own, so the lookup isn't counted as a call of the app.
+    async with session_maker() as session:
+        user_id = await get_user_id_by_identity_value(session, identity_value)
+    assert user_id is not None
+    return encode_activation_token(user_id)
+
+
+async def _run_flow(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    session_maker: async_sessionmaker[AsyncSession],
+    identity_value: str,
+    after_step: Callable[[str], Awaitable[None]] | None = None,
+) -> None:
+    async def step_done(step: str) -> None:
+        if after_step is not None:
+            await after_step(step)
+
+    name = identity_value.split("@")[0]
+    await recorder.request(
+        client,
+        "register",
+        201,
+        "POST",
+        "/v1/auth/register/",
+        json={
+            "identity_type": "email",
+            "identity_value": identity_value,
+            "password": _PASSWORD,
+            "confirm_password": _PASSWORD,
+            "full_name": name,
+            "username": name,
+            "avatar": f"https://example.com/{name}.jpg",
+        },
+    )
+    await step_done("register")
+
+    token = await _activation_token(session_maker, identity_value)
+    await recorder.request(
+        client,
+        "activate",
+        200,
+        "POST",
+        "/v1/auth/activate-account/",
+        json={"verification_code": token},
+    )
+    await step_done("activate")
+
+    response = await recorder.request(
+        client,
+        "login",
+        200,
+        "POST",
+        "/v1/auth/login/",
+        data={"username": identity_value, "password": _PASSWORD},
+    )
+    refresh_token = response.cookies["refresh_token"]
+    await step_done("login")
+
+    response = await recorder.request(
+        client,
+        "refresh",
+        200,
+        "POST",
+        "/v1/auth/refresh-token/",
+        headers={"Cookie": f"refresh_token={refresh_token}"},
+    )
+    access_token = response.json()["access_token"]
+    refresh_token = response.cookies["refresh_token"]
+    await step_done("refresh")
+
+    response = await recorder.request(
+        client,
+        "change-password",
+        200,
+        "PUT",
+        "/v1/auth/change-password/",
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            "Cookie": f"refresh_token={refresh_token}",
+        },
+        json={
+            "old_password": _PASSWORD,
+            "new_password": _NEW_PASSWORD,
+            "confirm_password": _NEW_PASSWORD,
+        },
+    )
+    refresh_token = response.cookies["refresh_token"]
+    await step_done("change-password")
+
+    await recorder.request(
+        client,
+        "logout",
+        204,
+        "GET",
+        "/v1/auth/logout/",
+        headers={"Cookie": f"refresh_token={refresh_token}"},
+    )
+    await step_done("logout")
+
+
+async def _call_counts(client: httpx.AsyncClient) -> tuple[float, float]:
+    response = await client.get("/metrics")
+    response.raise_for_status()
+    db_calls = redis_calls = 0.0
+    for family in text_string_to_metric_families(response.text):
+        for sample in family.samples:
+            if sample.name == "db_query_duration_seconds_count":
+                db_calls += sample.value
+            elif sample.name == "redis_command_duration_seconds_count":
+                redis_calls += sample.value
+    return db_calls, redis_calls
+
+
+async def _run_alone(
+    client: httpx.AsyncClient,
+    session_maker: async_sessionmaker[AsyncSession],
+    identity_value: str,
+    after_step: Callable[[str], Awaitable[None]] | None = None,
+) -> None:
+    recorder = Recorder()
+    try:
+        await _run_flow(client, recorder, session_maker, identity_value, after_step)
+    except StepFailed:
+        failed = {
+            step: dict(errors) for step, errors in recorder.errors.items() if errors
+        }
+        raise SystemExit(f"The flow of {identity_value} failed: {failed}")
+
+
+async def _calls_per_step(
+    client: httpx.AsyncClient,
+    session_maker: async_sessionmaker[AsyncSession],
+    run_id: str,
+) -> dict[str, dict[str, float]]:
+    """Counts the calls of one flow run alone, after a warm-up flow."""
+    await _run_alone(client, session_maker, f"bench-{run_id}-warmup@example.com")
+
+    calls: dict[str, dict[str, float]] = {}
+    before = await _call_counts(client)
+
+    async def after_step(step: str) -> None:
+        nonlocal before
+        after = await _call_counts(client)
+        calls[step] = {
+            "db_calls": after[0] - before[0],
+            "redis_calls": after[1] - before[1],
+        }
+        before = after
+
+    await _run_alone(
+        client, session_maker, f"bench-{run_id}-counted@example.com", after_step
+    )
+    return calls
+
+
+def _percentile(sorted_latencies: list[float], percentile: int) -> float:
+    if len(sorted_latencies) == 1:
+        return sorted_latencies[0]
+    return statistics.quantiles(sorted_latencies, n=100, method="inclusive")[
+        percentile - 1
+    ]
+
+
+def _step_report(
+    latencies: list[float], errors: Counter[str], duration: float
+) -> dict[str, Any]:
+    report: dict[str, Any] = {
+        "requests": len(latencies),
+        "errors": dict(errors),
+        "throughput_rps": round(len(latencies) / duration, 2),
+    }
+    if latencies:
+        latencies = sorted(latencies)
+        report |= {
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+            "max_ms": round(latencies[-1] * 1000, 3),
+        }
+    return report
+
+
+def _git_commit() -> dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def _asgi_client() -> AsyncIterator[httpx.AsyncClient]:
+    from src.main import app
+
+    # As uvicorn does, so scripts and keys are loaded before the first request.
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://benchmark"
+        ) as client:
+            yield client
+
+
+@asynccontextmanager
+async def _uvicorn_client(workers: int) -> AsyncIterator[httpx.AsyncClient]:
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as metrics_dir:
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "src.main:app",
+                "--host=127.0.0.1",
+                f"--port={port}",
+                f"--workers={workers}",
+                "--no-access-log",
+            ],
+            env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": metrics_dir},
+        )
+        try:
+            async with httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{port}",
+                limits=httpx.Limits(max_connections=None),
+                timeout=60,
+            ) as client:
+                for _ in range(300):
+                    if server.poll() is not None:
+                        raise SystemExit("uvicorn exited before serving requests.")
+                    try:
+                        await client.get("/metrics")
+                        break
+                    except httpx.TransportError:
+                        await asyncio.sleep(0.1)
+                else:
+                    raise SystemExit("uvicorn didn't start within 30 seconds.")
+                yield client
+        finally:
+            server.terminate()
+            server.wait()
+
+
+async def _benchmark(args: argparse.Namespace) -> dict[str, Any]:
+    engine = create_async_engine(str(settings.POSTGRES_URL))
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    if args.create_schema:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    run_id = uuid4().hex[:8]
+    started_at = datetime.now(timezone.utc).isoformat()
+    client_context = (
+        _asgi_client() if args.server == "asgi" else _uvicorn_client(args.workers)
+    )
+    try:
+        async with client_context as client:
+            calls = await _calls_per_step(client, session_maker, run_id)
+
+            recorder = Recorder()
+            flows = iter(range(args.flows))
+            completed = 0
+
+            async def virtual_user() -> None:
+                nonlocal completed
+                for i in flows:
+                    try:
+                        await _run_flow(
+                            client,
+                            recorder,
+                            session_maker,
+                            f"bench-{run_id}-{i}@example.com",
+                        )
+                        completed += 1
+                    except StepFailed:
+                        pass
+
+            start = time.perf_counter()
+            await asyncio.gather(*(virtual_user() for _ in range(args.concurrency)))
+            duration = time.perf_counter() - start
+    finally:
+        await engine.dispose()
+
+    requests = sum(len(latencies) for latencies in recorder.latencies.values())
+    return {
+        "benchmark": "auth_flows",
+        **_git_commit(),
+        "started_at": started_at,
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "server": args.server,
+            "workers": args.workers if args.server == "uvicorn" else None,
+            "concurrency": args.concurrency,
+            "flows": args.flows,
+            "environment": settings.ENVIRONMENT.value,
+            "bcrypt_rounds": auth_config.BCRYPT_ROUNDS,
+            "password_hasher_executor": auth_config.PASSWORD_HASHER_EXECUTOR,
+            "postgres_pool_size": settings.POSTGRES_POOL_SIZE,
+            "redis_max_connections": settings.REDIS_MAX_CONNECTIONS,
+        },
+        "duration_sec": round(duration, 3),
+        "completed_flows": completed,
+        "flows_per_sec": round(completed / duration, 2),
+        "requests_per_sec": round(requests / duration, 2),
+        "steps": {
+            step: {
+                **_step_report(
+                    recorder.latencies[step], recorder.errors[step], duration
+                ),
+                **calls.get(step, {}),
+            }
+            for step in STEPS
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.auth_flows")
+    parser.add_argument("--server", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--flows", type=int, default=200)
+    parser.add_argument("--create-schema", action="store_true")
+    parser.add_argument("--output", default=None, help="Defaults to stdout.")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(_benchmark(args)), indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, "w") as output:
+            output.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
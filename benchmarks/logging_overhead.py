@@ -0,0 +1,81 @@
+"""
+Time the calling thread (the event loop, in the app) spends per log call.
+
+Compares the handlers of `LogConfig` attached directly to the loggers, as
+they used to be, with `configure_logging`, which puts them behind a queue.
+Console output goes to /dev/null and the file handler to a temporary file.
+Calls are spaced by `--interval-us` of sleep, like logs between awaits of
+a request handler; only the time spent inside the calls is counted.
+
+Usage:
+    python -m benchmarks.logging_overhead --iterations 20000 --interval-us 100
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from logging.config import dictConfig
+from typing import Any
+
+from src.config import LogConfig
+from src.common.log import configure_logging, logging_stats, stop_logging
+
+
+def _config(log_dir: str) -> dict[str, Any]:
+    config = LogConfig().model_dump()
+    config["handlers"]["file"]["filename"] = os.path.join(log_dir, "app.log")
+    config["handlers"]["file"]["level"] = "INFO"
+    return config
+
+
+def _measure(
+    logger: logging.Logger, iterations: int, interval: float, level: int = logging.INFO
+) -> float:
+    spent = 0.0
+    for i in range(iterations):
+        start = time.perf_counter()
+        logger.log(level, "Benchmark message %s", i)
+        spent += time.perf_counter() - start
+        time.sleep(interval)
+    return spent / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.logging_overhead")
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--interval-us", type=float, default=100)
+    args = parser.parse_args()
+    interval = args.interval_us / 1e6
+
+    logger = logging.getLogger("auth")
+    stderr = sys.stderr
+    with tempfile.TemporaryDirectory() as log_dir, open(os.devnull, "w") as devnull:
+        sys.stderr = devnull  # Console handlers bind sys.stderr when created.
+        try:
+            dictConfig(_config(log_dir))
+            logger.setLevel(logging.INFO)
+            direct = _measure(logger, args.iterations, interval)
+
+            configure_logging(_config(log_dir))
+            logger.setLevel(logging.INFO)
+            queued = _measure(logger, args.iterations, interval)
+            # DEBUG calls below the INFO level of deployed environments.
+            skipped = _measure(logger, args.iterations, 0, logging.DEBUG)
+            stats = logging_stats()
+            start = time.perf_counter()
+            stop_logging()
+            drain = time.perf_counter() - start
+        finally:
+            sys.stderr = stderr
+
+    print(f"direct handlers: {direct * 1e6:.2f} us/call on the calling thread")
+    print(f"queue handler:   {queued * 1e6:.2f} us/call on the calling thread")
+    print(f"skipped debug:   {skipped * 1e6:.2f} us/call on the calling thread")
+    print(f"listener drained the rest in {drain:.2f} s, stats at the end: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Per-request CPU spent authenticating an access token.
+
+Compares the previous decode path (signature verification plus datetime
+based expiry check on every call) with `_decode_token`, which serves
+repeated tokens from the verified payload cache.
+
+Usage:
+    python -m benchmarks.token_decode --iterations 100000
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import jwt
+
+from src.auth.v1.config import auth_config
+from src.auth.v1.dependencies import _decode_token, token_payload_cache
+from src.auth.v1.types import UserId, UserRole
+from src.auth.v1.utils import encode_token
+
+
+def _decode_token_uncached(token: str) -> dict:
+    payload = jwt.decode(
+        jwt=token,
+        key=auth_config.SECRET_KEY,
+        algorithms=[auth_config.JWT_ALGORITHM],
+        options={"verify_exp": False},
+    )
+    expire_time = datetime.fromtimestamp(payload["exp"], tz=timezone.utc)
+    if expire_time < datetime.now(timezone.utc):
+        raise ValueError("expired")
+    return payload
+
+
+def _measure(func, token: str, iterations: int) -> float:
+    start = time.process_time()
+    for _ in range(iterations):
+        func(token)
+    return (time.process_time() - start) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.token_decode")
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    token = asyncio.run(
+        encode_token(
+            token_type="access_token",
+            user_id=UserId(uuid4()),
+            security_stamp=None,
+            role=UserRole.CUSTOMER,
+        )
+    )
+    before = _measure(_decode_token_uncached, token, args.iterations)
+    after = _measure(_decode_token, token, args.iterations)
+    print(f"uncached: {before * 1e6:.2f} us/request")
+    print(f"cached:   {after * 1e6:.2f} us/request ({before / after:.1f}x)")
+    print(f"cache:    {token_payload_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
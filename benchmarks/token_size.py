@@ -0,0 +1,113 @@
+"""
+Access token size with embedded permission claims versus the lookups they save.
+
+Prints the token and Authorization header size for growing permission
+bitmaps, and the CPU spent verifying each token without the payload cache.
+With `--user-id` of an existing provider staff, it also times the lookups
+`requires()` does for tokens without claims, against the configured
+Postgres and Redis: a cold one (Postgres) and one served by Redis.
+
+Usage:
+    python -m benchmarks.token_size --iterations 10000 [--user-id UUID]
+"""
+
+import argparse
+import asyncio
+import time
+from uuid import UUID, uuid4
+
+from src.auth.v1.dependencies import _decode_token, token_payload_cache
+from src.auth.v1.types import UserId, UserRole
+from src.auth.v1.utils import encode_token
+from src.database import session_maker, init_redis_pool, close_redis_pool
+from src.providers.v1.dependencies import get_staff_permissions, staff_permissions_cache
+from src.providers.v1.types import ProviderId
+
+# Highest permission id held by the staff; the bitmap grows with it.
+_MAX_PERMISSION_IDS = (8, 64, 256, 1024)
+
+
+def _measure_decode(token: str, iterations: int) -> float:
+    start = time.process_time()
+    for _ in range(iterations):
+        token_payload_cache.clear()
+        _decode_token(token)
+    return (time.process_time() - start) / iterations
+
+
+async def _tokens() -> list[tuple[str, str]]:
+    user_id, provider_id = UserId(uuid4()), ProviderId(uuid4())
+    tokens = [
+        (
+            "no claims",
+            await encode_token("access_token", user_id, None, UserRole.CUSTOMER),
+        ),
+        (
+            "founder",
+            await encode_token(
+                "access_token",
+                user_id,
+                None,
+                UserRole.PROVIDER,
+                provider_id=provider_id,
+                is_founder=True,
+            ),
+        ),
+    ]
+    for max_id in _MAX_PERMISSION_IDS:
+        # Every other permission up to `max_id`.
+        mask = sum(1 << permission_id for permission_id in range(1, max_id + 1, 2))
+        token = await encode_token(
+            "access_token",
+            user_id,
+            None,
+            UserRole.CUSTOMER,
+            provider_id=provider_id,
+            permission_mask=mask,
+        )
+        tokens.append((f"permissions up to id {max_id}", token))
+    return tokens
+
+
+async def _measure_lookups(user_id: UserId, iterations: int) -> None:
+    redis = init_redis_pool()
+    maker = await session_maker()
+    try:
+        cold = redis_hit = 0.0
+        for _ in range(iterations):
+            staff_permissions_cache.clear()
+            await redis.delete(f"staff-permissions:{user_id}")
+            start = time.perf_counter()
+            if await get_staff_permissions(maker, redis, user_id) is None:
+                raise SystemExit(f"{user_id} is not an active provider staff.")
+            cold += time.perf_counter() - start
+
+            staff_permissions_cache.clear()
+            start = time.perf_counter()
+            await get_staff_permissions(maker, redis, user_id)
+            redis_hit += time.perf_counter() - start
+        print(f"lookup from postgres: {cold / iterations * 1e6:.0f} us/request")
+        print(f"lookup from redis:    {redis_hit / iterations * 1e6:.0f} us/request")
+    finally:
+        await close_redis_pool()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.token_size")
+    parser.add_argument("--iterations", type=int, default=10_000)
+    parser.add_argument("--user-id", type=UUID, default=None)
+    args = parser.parse_args()
+
+    for label, token in asyncio.run(_tokens()):
+        header = len(f"Authorization: Bearer {token}\r\n")
+        decode = _measure_decode(token, args.iterations)
+        print(
+            f"{label:<26} token: {len(token):>4} B  header: {header:>4} B  "
+            f"verify: {decode * 1e6:.2f} us"
+        )
+    if args.user_id is not None:
+        asyncio.run(_measure_lookups(UserId(args.user_id), min(args.iterations, 1000)))
+
+
+if __name__ == "__main__":
+    main()
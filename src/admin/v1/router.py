@@ -6,8 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from src.database import session_maker
 from src.admin.v1 import services
-from src.auth.v1.dependencies import get_admin_user
-from src.auth.v1.models import User
+from src.auth.v1.dependencies import Principal, get_admin_user
 from src.providers.v1.types import ProviderId
 
 logger = logging.getLogger("admin")
@@ -67,7 +66,7 @@ router = APIRouter()
 )
 async def verify_provider(
     provider_id: ProviderId,
-    admin_user: Annotated[User, Depends(get_admin_user)],
+    admin_user: Annotated[Principal, Depends(get_admin_user)],
     session_maker: Annotated[async_sessionmaker[AsyncSession], Depends(session_maker)],
 ) -> None:
     await services.verify_provider(session_maker, provider_id)
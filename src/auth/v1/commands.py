@@ -0,0 +1,141 @@
+"""
+Maintenance commands for the auth module.
+
+Usage:
+    python -m src.auth.v1.commands backfill-security-stamp-index
+    python -m src.auth.v1.commands rebuild-identity-filter
+    python -m src.auth.v1.commands calibrate-bcrypt --target-ms 250
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from redis.asyncio import Redis
+
+from src.database import (
+    async_engine,
+    async_session_maker,
+    init_redis_pool,
+    close_redis_pool,
+)
+from src.auth.v1 import repositories
+from src.auth.v1.config import auth_config
+from src.auth.v1.dependencies import identity_filter
+from src.auth.v1.utils import pwd_context
+
+
+async def backfill_security_stamp_index(redis: Redis, batch_size: int = 1000) -> int:
+    """
+    Adds security stamps issued before the per-user index existed to
+    `security-stamps:{user_id}`, so revoking all sessions covers them too.
+    Uses SCAN instead of KEYS so Redis keeps serving other clients meanwhile.
+    """
+    indexed = 0
+    async with redis.pipeline(transaction=False) as pipe:
+        async for key in redis.scan_iter(match="security-stamp:*", count=batch_size):
+            key = key.decode() if isinstance(key, bytes) else key
+            _, user_id, _ = key.split(":", 2)
+            pipe.sadd(f"security-stamps:{user_id}", key)
+            pipe.expire(
+                f"security-stamps:{user_id}",
+                auth_config.REFRESH_TOKEN_LIFE_TIME_MINUTE * 60,
+            )
+            indexed += 1
+            if indexed % batch_size == 0:
+                await pipe.execute()
+        await pipe.execute()
+    return indexed
+
+
+async def _backfill_security_stamp_index() -> None:
+    redis = init_redis_pool()
+    try:
+        indexed = await backfill_security_stamp_index(redis)
+        print(f"Indexed {indexed} security stamps.")
+    finally:
+        await close_redis_pool()
+
+
+async def _rebuild_identity_filter(batch_size: int = 1000) -> None:
+    """
+    Builds the identity value filter from `user_identities`. Run it once
+    before relying on the filter, after resizing it, and whenever its false
+    positive rate drifts above IDENTITY_FILTER_ERROR_RATE.
+    """
+    redis = init_redis_pool()
+    try:
+        async with async_session_maker() as session:
+            added = await identity_filter.rebuild(
+                redis, repositories.iter_identity_values(session, batch_size)
+            )
+        stats = await identity_filter.stats(redis)
+        print(
+            f"Added {added} identity values to {identity_filter.key}, "
+            f"estimated false positive rate: {stats['estimated_fp_rate']:.4%}."
+        )
+    finally:
+        await close_redis_pool()
+        await async_engine.dispose()
+
+
+def calibrate_bcrypt(target_ms: float, samples: int = 5) -> int:
+    """
+    Times bcrypt on this machine for growing costs and returns the highest
+    one whose median hash time fits in `target_ms`. Each extra round doubles
+    the time, so costs are tried until one exceeds the budget.
+    """
+    recommended = 4  # bcrypt's minimum.
+    cpu_count = os.cpu_count() or 1
+    print(f"Hashes per second use all {cpu_count} cores.")
+    print(f"{'rounds':>6} {'median ms':>10} {'hashes/s':>10}")
+    for rounds in range(4, 32):
+        context = pwd_context.copy(bcrypt__rounds=rounds)
+        durations = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            context.hash("calibration-password")
+            durations.append(time.perf_counter() - start)
+        median_ms = statistics.median(durations) * 1000
+        print(f"{rounds:>6} {median_ms:>10.1f} {cpu_count * 1000 / median_ms:>10.1f}")
+        if median_ms > target_ms:
+            break
+        recommended = rounds
+    return recommended
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.auth.v1.commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(
+        "backfill-security-stamp-index",
+        help="Index security stamps created before the per-user index existed.",
+    )
+    subparsers.add_parser(
+        "rebuild-identity-filter",
+        help="Rebuild the Bloom filter of registered identity values.",
+    )
+    calibrate_parser = subparsers.add_parser(
+        "calibrate-bcrypt",
+        help="Recommend BCRYPT_ROUNDS for a hash time budget on this machine.",
+    )
+    calibrate_parser.add_argument("--target-ms", type=float, default=250)
+    args = parser.parse_args()
+
+    match args.command:
+        case "backfill-security-stamp-index":
+            asyncio.run(_backfill_security_stamp_index())
+        case "rebuild-identity-filter":
+            asyncio.run(_rebuild_identity_filter())
+        case "calibrate-bcrypt":
+            rounds = calibrate_bcrypt(args.target_ms)
+            print(
+                f"BCRYPT_ROUNDS={rounds} (currently {auth_config.BCRYPT_ROUNDS}); "
+                "existing hashes are rehashed on login."
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
+from typing import Literal
+
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 
+from src.config import settings
+
 
 class AuthConfig(BaseSettings):
     PASSWORD_PATTERN: str
@@ -10,6 +15,48 @@ class AuthConfig(BaseSettings):
     ACCESS_TOKEN_LIFE_TIME_MINUTE: int
     REFRESH_TOKEN_LIFE_TIME_MINUTE: int
     JWT_ALGORITHM: str
+    # Asymmetric algorithms only, see `src.auth.v1.keys`.
+    JWT_KEYS_DIR: str | None = None
+    JWT_ACTIVE_KID: str | None = None
+    JWKS_MAX_AGE_SEC: int = 3600
+    INTROSPECTION_MAX_TOKENS: int = 100
+    # Callers of the internal endpoints (introspection, `/internal/`) must send
+    # it as `X-Internal-Api-Key`. Only optional in debug environments.
+    INTROSPECTION_API_KEY: str | None = None
+    # Log2 of the bcrypt iterations; hashes with another cost are rehashed on
+    # login. `python -m src.auth.v1.commands calibrate-bcrypt` suggests one.
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASHER_EXECUTOR: Literal["thread", "process"] = "thread"
+    PASSWORD_HASHER_MAX_WORKERS: int | None = None  # Defaults to the CPU count.
+    PASSWORD_HASHER_MAX_PENDING: int = 64
+    # Login attempts allowed in a burst, then one more every `*_REFILL_SEC`.
+    LOGIN_ATTEMPTS_PER_IDENTITY: int = 5
+    LOGIN_IDENTITY_REFILL_SEC: float = 60
+    LOGIN_ATTEMPTS_PER_IP: int = 20
+    LOGIN_IP_REFILL_SEC: float = 3
+    # Sizes the Bloom filter of identity values; see `dependencies.identity_filter`.
+    IDENTITY_FILTER_CAPACITY: int = 1_000_000
+    IDENTITY_FILTER_ERROR_RATE: float = 0.01
+    SECURITY_STAMP_CACHE_MAX_ENTRIES: int = 10000
+    # Upper bound for a revoked security stamp to stop working on every worker.
+    SECURITY_STAMP_CACHE_TTL_SEC: float = 10
+    TOKEN_PAYLOAD_CACHE_MAX_ENTRIES: int = 10000
+    TOKEN_PAYLOAD_CACHE_TTL_SEC: float = 3600  # Entries are evicted at `exp` anyway.
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = 10000
+    PRINCIPAL_CACHE_TTL_SEC: float = 10
+    # Fallback bound on staleness if an invalidation is missed.
+    PRINCIPAL_REDIS_TTL_SEC: int = 300
+    # Staff permission changes only reach embedded claims once the access
+    # token is refreshed, so keep ACCESS_TOKEN_LIFE_TIME_MINUTE short with it.
+    EMBED_PERMISSION_CLAIMS: bool = False
+
+    @model_validator(mode="after")
+    def require_internal_api_key(self) -> "AuthConfig":
+        if self.INTROSPECTION_API_KEY is None and not settings.ENVIRONMENT.is_debug:
+            raise ValueError(
+                "INTROSPECTION_API_KEY must be set outside debug environments."
+            )
+        return self
 
 
 auth_config = AuthConfig()  # type: ignore
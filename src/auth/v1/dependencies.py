@@ -1,11 +1,14 @@
+import hashlib
+import json
 import logging
-from typing import TypedDict, Annotated
-from datetime import datetime, timezone
+import secrets
+import time
+from typing import NotRequired, TypedDict, Annotated, cast
 
 import jwt
 from jwt.exceptions import ExpiredSignatureError, PyJWTError
 from redis.asyncio import Redis
-from fastapi import Depends
+from fastapi import Depends, Header
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
@@ -13,36 +16,86 @@ from src.database import session_maker, redis_conn
 from src.auth.v1 import exceptions
 from src.auth.v1 import repositories
 from src.auth.v1.config import auth_config
+from src.auth.v1.keys import get_key_set
 from src.auth.v1.types import UserId, UserRole
-from src.auth.v1.models import User
-from src.common.repositories import get_value_from_cache
+from src.common.bloom import BloomFilter
+from src.common.cache import TTLCache, publish_invalidation
+from src.common.repositories import get_value_from_cache, set_key_to_cache
 
 logger = logging.getLogger("auth")
 
 oauth2_schema = OAuth2PasswordBearer(tokenUrl="/v1/auth/login/")
 
+security_stamp_cache = TTLCache(
+    name="security-stamp",
+    maxsize=auth_config.SECURITY_STAMP_CACHE_MAX_ENTRIES,
+    ttl=auth_config.SECURITY_STAMP_CACHE_TTL_SEC,
+)
+
+# Verified payloads keyed by token digest, so repeated tokens skip signature checks.
+token_payload_cache = TTLCache(
+    name="token-payload",
+    maxsize=auth_config.TOKEN_PAYLOAD_CACHE_MAX_ENTRIES,
+    ttl=auth_config.TOKEN_PAYLOAD_CACHE_TTL_SEC,
+)
+
+# Role and active flag of users, so authorizing admins doesn't query Postgres.
+principal_cache = TTLCache(
+    name="principal",
+    maxsize=auth_config.PRINCIPAL_CACHE_MAX_ENTRIES,
+    ttl=auth_config.PRINCIPAL_CACHE_TTL_SEC,
+)
+
+# Lets lookups of unknown identity values skip Postgres. Built with the
+# `rebuild-identity-filter` command; every value is a "maybe" until then.
+identity_filter = BloomFilter(
+    name="identity-values",
+    capacity=auth_config.IDENTITY_FILTER_CAPACITY,
+    error_rate=auth_config.IDENTITY_FILTER_ERROR_RATE,
+)
+
 
 class TokenPayload(TypedDict):
     exp: int
     user_id: UserId
-    is_founder: bool | None
     security_stamp: str
     role: UserRole
+    jti: NotRequired[str]  # Refresh tokens only.
+    fam: NotRequired[str]  # Refresh tokens only.
+    # Provider staff only, when permission claims are embedded.
+    pid: NotRequired[str]
+    fnd: NotRequired[bool]
+    perms: NotRequired[str]  # `utils.encode_permission_mask` of the bitmap.
+
+
+class Principal(TypedDict):
+    user_id: UserId
+    role: UserRole
+    is_active: bool
 
 
-def _decode_token(token: str) -> TokenPayload:
+def _decode_token(token: str | None) -> TokenPayload:
+    if not token:
+        raise exceptions.InvalidTokenExc
+    digest = hashlib.sha256(token.encode()).digest()
     try:
-        payload: TokenPayload = jwt.decode(
-            jwt=token,
-            key=auth_config.SECRET_KEY,
-            algorithms=[auth_config.JWT_ALGORITHM],
-            options={"verify_exp": False},
-        )
+        cached: TokenPayload | None = token_payload_cache.get(digest)
+        if cached is not None:
+            payload = cached
+        else:
+            payload = cast(
+                TokenPayload,
+                jwt.decode(
+                    jwt=token,
+                    key=get_key_set().verification_key(token),
+                    algorithms=[auth_config.JWT_ALGORITHM],
+                    options={"verify_exp": False},
+                ),
+            )
+            token_payload_cache.set(digest, payload, expires_at=payload.get("exp"))
         exp = payload.get("exp")
-        if exp is not None:
-            expire_time = datetime.fromtimestamp(exp, tz=timezone.utc)
-            if expire_time < datetime.now(timezone.utc):
-                raise ExpiredSignatureError
+        if exp is not None and exp < int(time.time()):
+            raise ExpiredSignatureError
         return payload
     except ExpiredSignatureError as e:
         logger.info(e)
@@ -58,7 +111,7 @@ def decode_access_token(
     return _decode_token(access_token)
 
 
-def decode_refresh_token(refresh_token: str) -> TokenPayload:
+def decode_refresh_token(refresh_token: str | None) -> TokenPayload:
     return _decode_token(refresh_token)
 
 
@@ -71,34 +124,115 @@ async def check_security_stamp(
     user_id = token_data.get("user_id")
     assert user_id is not None
     security_stamp = token_data.get("security_stamp")  # Check security stamp validity
-    if (not security_stamp) or (
-        not await get_value_from_cache(
-            redis, f"security-stamp:{user_id}:{security_stamp}"
-        )
-    ):
+    if not security_stamp:
         raise exceptions.SecurityStampChangedExc
+    key = f"security-stamp:{user_id}:{security_stamp}"
+    if security_stamp_cache.get(key) is None:
+        if not await get_value_from_cache(redis, key):
+            raise exceptions.SecurityStampChangedExc
+        security_stamp_cache.set(key, True, expires_at=token_data.get("exp"))
     return token_data
 
 
+async def check_security_stamps(
+    redis: Redis, payloads: list[TokenPayload]
+) -> list[bool]:
+    """Batch version of `check_security_stamp` doing at most one MGET."""
+    keys = [
+        f"security-stamp:{payload.get('user_id')}:{payload.get('security_stamp')}"
+        for payload in payloads
+    ]
+    valid = [
+        bool(payload.get("security_stamp"))
+        and security_stamp_cache.get(key) is not None
+        for payload, key in zip(payloads, keys)
+    ]
+    missing = [
+        index
+        for index, payload in enumerate(payloads)
+        if payload.get("security_stamp") and not valid[index]
+    ]
+    if missing:
+        values = await redis.mget([keys[index] for index in missing])
+        for index, value in zip(missing, values):
+            if value:
+                valid[index] = True
+                security_stamp_cache.set(
+                    keys[index], True, expires_at=payloads[index].get("exp")
+                )
+    return valid
+
+
+def check_internal_api_key(
+    x_internal_api_key: Annotated[str | None, Header()] = None,
+) -> None:
+    if auth_config.INTROSPECTION_API_KEY is None:
+        return  # Debug environments only, see `AuthConfig`.
+    if x_internal_api_key is None or not secrets.compare_digest(
+        x_internal_api_key, auth_config.INTROSPECTION_API_KEY
+    ):
+        raise exceptions.InvalidApiKeyExc
+
+
 async def get_user_id(
     token_data: Annotated[TokenPayload, Depends(check_security_stamp)],
 ) -> UserId:
     return token_data["user_id"]
 
 
+def _principal_key(user_id: UserId) -> str:
+    return f"principal:{user_id}"
+
+
+async def get_principal(
+    session_maker: async_sessionmaker[AsyncSession], redis: Redis, user_id: UserId
+) -> Principal | None:
+    """
+    Looks the principal up in the local cache, then in Redis, then in Postgres.
+    `invalidate_principal` must be called whenever the role or active flag changes.
+    """
+    key = _principal_key(user_id)
+    principal: Principal | None = principal_cache.get(key)
+    if principal is not None:
+        return principal
+    cached = await get_value_from_cache(redis, key)
+    if cached is not None:
+        principal = json.loads(cached)
+    else:
+        async with session_maker.begin() as session:
+            row = await repositories.get_user_principal(session, user_id)
+        if row is None:
+            return None
+        principal = {"user_id": user_id, "role": row[0], "is_active": row[1]}
+        await set_key_to_cache(
+            redis, key, json.dumps(principal), ex=auth_config.PRINCIPAL_REDIS_TTL_SEC
+        )
+    principal_cache.set(key, principal)
+    return principal
+
+
+async def invalidate_principal(redis: Redis, user_id: UserId) -> None:
+    key = _principal_key(user_id)
+    await redis.delete(key)
+    await publish_invalidation(redis, principal_cache.name, key)
+
+
 async def get_admin_user(
     token_data: Annotated[TokenPayload, Depends(check_security_stamp)],
     session_maker: Annotated[async_sessionmaker[AsyncSession], Depends(session_maker)],
-) -> User:
-    async with session_maker.begin() as session:
-        user = await repositories.get_user_by_id(session, token_data["user_id"])
-        if user is None:
-            raise exceptions.InvalidTokenExc
-        if not user.is_active:
-            raise exceptions.AccountNotActiveExc
-        if user.role != UserRole.ADMIN:
-            raise exceptions.UserNotAdminExc
-        return user
+    redis: Annotated[Redis, Depends(redis_conn)],
+) -> Principal:
+    # The role claim is signed, so non admins are rejected without any lookup.
+    if token_data.get("role") != UserRole.ADMIN:
+        raise exceptions.UserNotAdminExc
+    principal = await get_principal(session_maker, redis, token_data["user_id"])
+    if principal is None:
+        raise exceptions.InvalidTokenExc
+    if not principal["is_active"]:
+        raise exceptions.AccountNotActiveExc
+    if principal["role"] != UserRole.ADMIN:
+        raise exceptions.UserNotAdminExc
+    return principal
 
 
 # async def get_current_active_founder(data: Annotated[TokenPayload, Depends(decode_access_token)]) -> bool:
@@ -77,3 +77,22 @@ class UserNotAdminExc(HTTPException):
     def __init__(self) -> None:
         self.status_code = status.HTTP_403_FORBIDDEN
         self.detail = "Only admin users can access this resource."
+
+
+class PasswordHasherBusyExc(HTTPException):
+    def __init__(self) -> None:
+        self.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        self.detail = "Server is busy,try again later."
+
+
+class TooManyLoginAttemptsExc(HTTPException):
+    def __init__(self, retry_after: int) -> None:
+        self.status_code = status.HTTP_429_TOO_MANY_REQUESTS
+        self.detail = "Too many login attempts,try again later."
+        self.headers = {"Retry-After": str(retry_after)}
+
+
+class InvalidApiKeyExc(HTTPException):
+    def __init__(self) -> None:
+        self.status_code = status.HTTP_401_UNAUTHORIZED
+        self.detail = "Invalid internal api key."
@@ -0,0 +1,120 @@
+"""
+Keys signing and verifying JWTs.
+
+HS* algorithms sign with `SECRET_KEY`. Asymmetric ones (RS256, ES256, EdDSA)
+load every `<kid>.pem` file of `JWT_KEYS_DIR` once at startup: private keys
+can sign, public keys only verify. Tokens are signed with `JWT_ACTIVE_KID`,
+which is put in their `kid` header, and verified with the key of that kid.
+
+Rotating keys:
+    1. Add the new private key and restart, so its public key is served
+       by the JWKS route before any token is signed with it.
+    2. Once verifiers refreshed the key set, point `JWT_ACTIVE_KID` at it.
+    3. Replace the old private key with its public key, and remove it after
+       REFRESH_TOKEN_LIFE_TIME_MINUTE.
+
+Asymmetric keys need the `cryptography` package (`jwt-asymmetric` extra).
+"""
+
+import logging
+from pathlib import Path
+from typing import Any
+
+import jwt
+from jwt.algorithms import get_default_algorithms
+from jwt.exceptions import InvalidKeyError
+
+from src.auth.v1.config import auth_config
+
+logger = logging.getLogger("auth")
+
+
+class KeySet:
+    def __init__(
+        self,
+        algorithm: str,
+        signing_kid: str | None,
+        signing_key: Any,
+        verification_keys: dict[str, Any],
+    ) -> None:
+        self.algorithm = algorithm
+        self.signing_kid = signing_kid
+        self.signing_key = signing_key
+        self.verification_keys = verification_keys
+        self.jwks = {
+            "keys": [self._to_jwk(kid, key) for kid, key in verification_keys.items()]
+        }
+
+    def _to_jwk(self, kid: str, public_key: Any) -> dict[str, Any]:
+        algorithm = get_default_algorithms()[self.algorithm]
+        jwk = algorithm.to_jwk(public_key, as_dict=True)
+        return {**jwk, "kid": kid, "use": "sig", "alg": self.algorithm}
+
+    def headers(self) -> dict[str, str] | None:
+        return {"kid": self.signing_kid} if self.signing_kid is not None else None
+
+    def verification_key(self, token: str) -> Any:
+        if self.signing_kid is None:
+            return self.signing_key
+        kid = jwt.get_unverified_header(token).get("kid")
+        if not isinstance(kid, str):
+            raise InvalidKeyError("Missing key id.")
+        key = self.verification_keys.get(kid)
+        if key is None:
+            raise InvalidKeyError(f"Unknown key id {kid!r}.")
+        return key
+
+
+def _load_pem_keys(keys_dir: Path) -> tuple[dict[str, Any], dict[str, Any]]:
+    try:
+        from cryptography.hazmat.primitives.serialization import (
+            load_pem_private_key,
+            load_pem_public_key,
+        )
+    except ImportError as ex:
+        raise RuntimeError(
+            "Asymmetric JWT algorithms need the `jwt-asymmetric` extra."
+        ) from ex
+
+    private_keys: dict[str, Any] = {}
+    public_keys: dict[str, Any] = {}
+    for path in sorted(keys_dir.glob("*.pem")):
+        pem = path.read_bytes()
+        if b"PRIVATE KEY" in pem:
+            private_keys[path.stem] = load_pem_private_key(pem, password=None)
+            public_keys[path.stem] = private_keys[path.stem].public_key()
+        else:
+            public_keys[path.stem] = load_pem_public_key(pem)
+    return private_keys, public_keys
+
+
+def load_key_set() -> KeySet:
+    global _key_set
+    algorithm = auth_config.JWT_ALGORITHM
+    if algorithm.startswith("HS"):
+        _key_set = KeySet(algorithm, None, auth_config.SECRET_KEY, {})
+        return _key_set
+
+    if auth_config.JWT_KEYS_DIR is None or auth_config.JWT_ACTIVE_KID is None:
+        raise RuntimeError(f"{algorithm} needs JWT_KEYS_DIR and JWT_ACTIVE_KID.")
+    private_keys, public_keys = _load_pem_keys(Path(auth_config.JWT_KEYS_DIR))
+    if auth_config.JWT_ACTIVE_KID not in private_keys:
+        raise RuntimeError(
+            f"No private key {auth_config.JWT_ACTIVE_KID}.pem in JWT_KEYS_DIR."
+        )
+    _key_set = KeySet(
+        algorithm,
+        auth_config.JWT_ACTIVE_KID,
+        private_keys[auth_config.JWT_ACTIVE_KID],
+        public_keys,
+    )
+    logger.info(f"Loaded JWT keys {sorted(public_keys)}.")
+    return _key_set
+
+
+_key_set: KeySet | None = None
+
+
+def get_key_set() -> KeySet:
+    # Loaded in the lifespan; lazily as well for apps running without it.
+    return _key_set if _key_set is not None else load_key_set()
@@ -1,12 +1,15 @@
 import logging
-from typing import Any
+from uuid import uuid4
+from typing import Any, AsyncIterator
 
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.auth.v1 import models
 from src.auth.v1 import types
-from src.common.exceptions import CheckDbConnection
+from src.providers.v1 import models as provider_models
+from src.providers.v1.types import ProviderId
 
 logger = logging.getLogger("auth")
 
@@ -18,6 +21,15 @@ async def get_user_by_id(
     return await db_session.scalar(smtm)
 
 
+async def get_user_principal(
+    db_session: AsyncSession, user_id: types.UserId
+) -> tuple[types.UserRole, bool] | None:
+    smtm = sa.select(models.User.role, models.User.is_active).where(
+        models.User.id == user_id
+    )
+    return (await db_session.execute(smtm)).tuples().first()
+
+
 async def get_user_passwd_by_id(
     db_session: AsyncSession, user_id: types.UserId
 ) -> str | None:
@@ -34,29 +46,132 @@ async def get_user_id_by_identity_value(
     return await db_session.scalar(smtm)
 
 
-async def create_user(
-    db_session: AsyncSession, hashed_password: str, is_provider: bool
-) -> types.UserId:
-    smtm = (
+async def iter_identity_values(
+    db_session: AsyncSession, batch_size: int
+) -> AsyncIterator[list[str]]:
+    """Streams every identity value with a server side cursor."""
+    result = await db_session.stream_scalars(
+        sa.select(models.UserIdentity.identity_value).execution_options(
+            yield_per=batch_size
+        )
+    )
+    async for values in result.partitions():
+        yield list(values)
+
+
+async def register_user(
+    db_session: AsyncSession,
+    *,
+    hashed_password: str,
+    identity_type: types.IdentityType,
+    identity_value: str,
+    full_name: str,
+    username: str,
+    avatar: str,
+    company_name: str | None,
+) -> tuple[types.UserId, types.RegistrationConflict | None]:
+    """
+    Inserts the user, its identity and, for providers, the provider and its
+    founder staff in a single statement.
+    Conflicting inserts are skipped instead of raising, so the caller must
+    roll back the transaction when a conflict is returned.
+    """
+    user_id = types.UserId(uuid4())
+    # WITH new_user AS (INSERT INTO users ... RETURNING id),
+    # new_identity AS (
+    #     INSERT INTO user_identities SELECT ... FROM new_user
+    #     ON CONFLICT (identity_type, identity_value) DO NOTHING RETURNING user_id
+    # ),
+    # new_provider AS (
+    #     INSERT INTO providers ... ON CONFLICT (name) DO NOTHING RETURNING id
+    # ),
+    # new_staff AS (
+    #     INSERT INTO provider_staff SELECT ... FROM new_provider, new_identity
+    #     RETURNING id
+    # )
+    # SELECT (SELECT user_id FROM new_identity), (SELECT id FROM new_provider)
+    user_cte = (
         sa.insert(models.User)
         .values(
             {
-                models.User.role: types.UserRole.CUSTOMER
-                if not is_provider
-                else types.UserRole.PROVIDER,
+                models.User.id: user_id,
+                models.User.role: types.UserRole.PROVIDER
+                if company_name is not None
+                else types.UserRole.CUSTOMER,
                 models.User.hashed_password: hashed_password,
+                models.User.is_active: False,
             }
         )
         .returning(models.User.id)
+        .cte("new_user")
+    )
+    identity_cte = (
+        postgresql.insert(models.UserIdentity)
+        .from_select(
+            [
+                models.UserIdentity.user_id,
+                models.UserIdentity.identity_type,
+                models.UserIdentity.identity_value,
+                models.UserIdentity.full_name,
+                models.UserIdentity.username,
+                models.UserIdentity.avatar,
+            ],
+            sa.select(
+                user_cte.c.id,
+                sa.literal(identity_type, models.UserIdentity.identity_type.type),
+                sa.literal(identity_value),
+                sa.literal(full_name),
+                sa.literal(username),
+                sa.literal(avatar),
+            ),
+        )
+        .on_conflict_do_nothing(index_elements=["identity_type", "identity_value"])
+        .returning(models.UserIdentity.user_id)
+        .cte("new_identity")
     )
-    try:
-        user_id = await db_session.scalar(smtm)
-        if not user_id:
-            raise CheckDbConnection
-        return user_id
-    except Exception as ex:
-        logger.error(ex)
-        raise CheckDbConnection
+    columns = [sa.select(identity_cte.c.user_id).scalar_subquery()]
+
+    if company_name is not None:
+        provider_cte = (
+            postgresql.insert(provider_models.Provider)
+            .values(
+                {
+                    provider_models.Provider.id: ProviderId(uuid4()),
+                    provider_models.Provider.name: company_name,
+                    provider_models.Provider.is_active: False,
+                }
+            )
+            .on_conflict_do_nothing(index_elements=["name"])
+            .returning(provider_models.Provider.id)
+            .cte("new_provider")
+        )
+        staff_cte = (
+            sa.insert(provider_models.ProviderStaff)
+            .from_select(
+                [
+                    provider_models.ProviderStaff.provider_id,
+                    provider_models.ProviderStaff.user_id,
+                    provider_models.ProviderStaff.is_founder,
+                    provider_models.ProviderStaff.is_active,
+                ],
+                sa.select(
+                    provider_cte.c.id, identity_cte.c.user_id, sa.true(), sa.true()
+                ),
+            )
+            .returning(provider_models.ProviderStaff.id)
+            .cte("new_staff")
+        )
+        columns += [
+            sa.select(provider_cte.c.id).scalar_subquery(),
+            sa.select(staff_cte.c.id).scalar_subquery(),
+        ]
+
+    row = (await db_session.execute(sa.select(*columns))).one()
+    if row[0] is None:
+        return user_id, types.RegistrationConflict.IDENTITY
+    if company_name is not None and row[1] is None:
+        return user_id, types.RegistrationConflict.COMPANY_NAME
+    return user_id, None
 
 
 async def get_user_credentials_by_identity_value(
@@ -87,28 +202,6 @@ async def get_user_credentials_by_identity_value(
 # # async def get_user_roles()
 
 
-async def create_user_identity(
-    db_session: AsyncSession,
-    user_id: types.UserId,
-    identity_type: types.IdentityType,
-    identity_value: str,
-    full_name: str,
-    username: str,
-    avatar: str,
-) -> None:
-    smtm = sa.insert(models.UserIdentity).values(
-        {
-            models.UserIdentity.user_id: user_id,
-            models.UserIdentity.identity_type: identity_type,
-            models.UserIdentity.identity_value: identity_value,
-            models.UserIdentity.full_name: full_name,
-            models.UserIdentity.avatar: avatar,
-            models.UserIdentity.username: username,
-        }
-    )
-    await db_session.execute(smtm)
-
-
 async def check_user_existence_and_account_activation_status(
     db_session: AsyncSession, identity_type: types.IdentityType, identity_value: Any
 ) -> tuple[types.UserId, bool] | None:
@@ -136,6 +229,26 @@ async def activate_user_account(
     await db_session.execute(smtm)
 
 
+async def replace_password_hash(
+    db_session: AsyncSession,
+    user_id: types.UserId,
+    old_hashed_password: str,
+    new_hashed_password: str,
+) -> bool:
+    """Leaves the password alone if it changed since `old_hashed_password` was read."""
+    smtm = (
+        sa.update(models.User)
+        .values({models.User.hashed_password: new_hashed_password})
+        .where(
+            sa.and_(
+                models.User.id == user_id,
+                models.User.hashed_password == old_hashed_password,
+            )
+        )
+    )
+    return (await db_session.execute(smtm)).rowcount == 1
+
+
 async def update_user_password(
     db_session: AsyncSession, user_id: types.UserId, hashed_password: str
 ) -> None:
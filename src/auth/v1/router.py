@@ -1,7 +1,15 @@
 from typing import Annotated
 
 from redis.asyncio import Redis
-from fastapi import APIRouter, Response, status, Depends, Cookie
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Cookie,
+    Depends,
+    Request,
+    Response,
+    status,
+)
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
@@ -11,7 +19,8 @@ from src.auth.v1 import schemas
 from src.auth.v1 import services
 from src.auth.v1.config import auth_config
 from src.auth.v1.types import UserId
-from src.auth.v1.dependencies import get_user_id
+from src.auth.v1.dependencies import get_user_id, check_internal_api_key
+from src.auth.v1.keys import get_key_set
 
 router = APIRouter()
 
@@ -56,6 +65,13 @@ router = APIRouter()
                 }
             }
         },
+        503: {
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Server is busy,try again later."}
+                }
+            }
+        },
     },
 )
 async def register(
@@ -81,7 +97,7 @@ async def register(
     "/activate-account/",
     status_code=status.HTTP_200_OK,
     description=f"""
-- ***VerificationCode*** must be exact 6 digits.
+- ***VerificationCode*** is the signed activation token sent by email or SMS, usable once.
 - ***Verification code*** has {auth_config.VERIFY_ACCOUNT_MESSAGE_LIFETIME_SEC} seconds life time.
     """,
     responses={
@@ -184,16 +200,37 @@ async def resend_verification_code(
                 }
             }
         },
+        503: {
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Server is busy,try again later."}
+                }
+            }
+        },
+        429: {
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Too many login attempts,try again later."}
+                }
+            }
+        },
     },
 )
 async def login(
+    request: Request,
     response: Response,
+    background_tasks: BackgroundTasks,
     session_maker: Annotated[async_sessionmaker[AsyncSession], Depends(session_maker)],
     redis: Annotated[Redis, Depends(redis_conn)],
     payload: Annotated[OAuth2PasswordRequestForm, Depends()],
 ) -> dict:
     tokens = await services.login(
-        session_maker, redis, payload.username, payload.password
+        session_maker,
+        redis,
+        background_tasks,
+        payload.username,
+        payload.password,
+        request.client.host if request.client else "unknown",
     )
     response.set_cookie(
         key="refresh_token",
@@ -247,10 +284,11 @@ async def login(
 )
 async def get_refresh_token(
     response: Response,
+    session_maker: Annotated[async_sessionmaker[AsyncSession], Depends(session_maker)],
     redis: Annotated[Redis, Depends(redis_conn)],
     refresh_token: str = Cookie(None),
 ) -> dict:
-    tokens = await services.get_refresh_token(redis, refresh_token)
+    tokens = await services.get_refresh_token(session_maker, redis, refresh_token)
     response.set_cookie(
         key="refresh_token",
         value=tokens.refresh_token,
@@ -290,6 +328,13 @@ async def logout(
                 }
             }
         },
+        503: {
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Server is busy,try again later."}
+                }
+            }
+        },
     },
 )
 async def reset_password(
@@ -335,6 +380,13 @@ async def reset_password(
                 }
             }
         },
+        503: {
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Server is busy,try again later."}
+                }
+            }
+        },
     },
 )
 async def change_password(
@@ -358,3 +410,84 @@ async def change_password(
         path="/",
     )
     return {"access_token": tokens.access_token}
+
+
+@router.get(
+    "/.well-known/jwks.json",
+    status_code=status.HTTP_200_OK,
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "keys": [
+                            {
+                                "kty": "OKP",
+                                "crv": "Ed25519",
+                                "x": "11qYAYKxCrfVS_7TyWQHOg7hcvPapiMlrwIaaPcHURo",
+                                "kid": "2025-01",
+                                "use": "sig",
+                                "alg": "EdDSA",
+                            }
+                        ]
+                    }
+                }
+            }
+        },
+    },
+)
+async def jwks(response: Response) -> dict:
+    # Empty for HMAC algorithms, whose key must never be published.
+    response.headers["Cache-Control"] = (
+        f"public, max-age={auth_config.JWKS_MAX_AGE_SEC}"
+    )
+    return get_key_set().jwks
+
+
+@router.post(
+    "/introspect/batch/",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.IntrospectBatchOut,
+    dependencies=[Depends(check_internal_api_key)],
+    description=f"""
+- For internal services that can't verify tokens locally.
+- Takes up to {auth_config.INTROSPECTION_MAX_TOKENS} tokens and returns one result per token, in order.
+- ***X-Internal-Api-Key*** header is required, except in debug environments without a configured key.
+    """,
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "results": [
+                            {
+                                "active": True,
+                                "user_id": "06a0b637-7475-4ed8-86de-d252162cf650",
+                                "role": "customer",
+                                "exp": 1745000000,
+                                "detail": None,
+                            },
+                            {
+                                "active": False,
+                                "user_id": None,
+                                "role": None,
+                                "exp": None,
+                                "detail": "Token has been expired.",
+                            },
+                        ]
+                    }
+                }
+            }
+        },
+        401: {
+            "content": {
+                "application/json": {"example": {"detail": "Invalid internal api key."}}
+            }
+        },
+    },
+)
+async def introspect_batch(
+    redis: Annotated[Redis, Depends(redis_conn)],
+    payload: schemas.IntrospectBatchIn,
+) -> schemas.IntrospectBatchOut:
+    return await services.introspect_tokens(redis, payload.tokens)
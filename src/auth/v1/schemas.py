@@ -55,7 +55,10 @@ class RegisterIn(RegisterOut):
 
 
 class ActivateAccountIn(BaseModel):
-    verification_code: Annotated[str, Field(max_length=6)]
+    # `utils.encode_activation_token` output.
+    verification_code: Annotated[
+        str, Field(pattern=r"^[0-9a-f]{32}\.[0-9]{1,12}\.[A-Za-z0-9_-]{22}$")
+    ]
 
 
 class IdentityValueIn(BaseModel):
@@ -117,6 +120,30 @@ class ChangePasswordOut(BaseModel):
     access_token: str
 
 
+class IntrospectBatchIn(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "examples": [{"tokens": ["eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJ1c2V"]}]
+        }
+    )
+    tokens: Annotated[
+        list[str],
+        Field(min_length=1, max_length=auth_config.INTROSPECTION_MAX_TOKENS),
+    ]
+
+
+class IntrospectionResult(BaseModel):
+    active: bool
+    user_id: types.UserId | None = None
+    role: types.UserRole | None = None
+    exp: int | None = None
+    detail: str | None = None  # Why the token is not active.
+
+
+class IntrospectBatchOut(BaseModel):
+    results: list[IntrospectionResult]  # In the order of the tokens sent.
+
+
 # class UsersOut(BaseModel):
 #     id: types.UserId
 #     username: str
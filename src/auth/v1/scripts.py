@@ -0,0 +1,229 @@
+"""
+Atomic Redis operations behind the token flows.
+
+Each flow is one EVALSHA round trip. Revocations publish their cache
+invalidation from inside the script.
+
+Refresh tokens are whitelisted per family as `refresh-token:{family}`
+holding the jti of the family's latest token. Presenting an older jti of
+a live family means a rotated-out token was replayed, so the family and
+its security stamp are revoked.
+
+Security stamps and refresh token families of a user are tracked in the
+`security-stamps:{user_id}` index. Scripts revoking every session read
+the keys from that index, which is fine on a single Redis but not on
+Redis Cluster.
+"""
+
+import logging
+
+from redis.asyncio import Redis
+
+from src.auth.v1.config import auth_config
+from src.auth.v1.types import UserId
+from src.common.cache import INVALIDATION_CHANNEL, invalidate_locally
+from src.common.repositories import LuaScript
+
+logger = logging.getLogger("auth")
+
+# KEYS: security stamp, security stamp index, refresh token family
+# ARGV: user id, security stamp ttl, refresh token ttl, jti
+_ISSUE_SESSION = LuaScript(
+    """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('SET', KEYS[3], ARGV[4], 'EX', ARGV[3])
+redis.call('SADD', KEYS[2], KEYS[1], KEYS[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+)
+
+# KEYS: refresh token family, security stamp, security stamp index
+# ARGV: user id, security stamp ttl, refresh token ttl, jti, new jti,
+#       invalidation channel, cache name
+_ROTATE_REFRESH_TOKEN = LuaScript(
+    """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    return 0
+end
+if current ~= ARGV[4] then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    redis.call('SREM', KEYS[3], KEYS[1], KEYS[2])
+    redis.call('PUBLISH', ARGV[6], ARGV[7] .. ' ' .. KEYS[2])
+    return -1
+end
+redis.call('SET', KEYS[1], ARGV[5], 'EX', ARGV[3])
+redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[2])
+redis.call('SADD', KEYS[3], KEYS[1], KEYS[2])
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+return 1
+"""
+)
+
+# KEYS: refresh token family, security stamp, security stamp index
+# ARGV: invalidation channel, cache name
+_END_SESSION = LuaScript(
+    """
+redis.call('DEL', KEYS[1], KEYS[2])
+redis.call('SREM', KEYS[3], KEYS[1], KEYS[2])
+redis.call('PUBLISH', ARGV[1], ARGV[2] .. ' ' .. KEYS[2])
+return 1
+"""
+)
+
+# Shared by the scripts revoking every session of a user.
+# KEYS[1]: security stamp index, ARGV[1]: invalidation channel, ARGV[2]: cache name
+_REVOKE_INDEXED = """
+local revoked = redis.call('SMEMBERS', KEYS[1])
+for _, key in ipairs(revoked) do
+    redis.call('DEL', key)
+end
+redis.call('DEL', KEYS[1])
+if #revoked > 0 then
+    redis.call('PUBLISH', ARGV[1], ARGV[2] .. ' ' .. table.concat(revoked, ' '))
+end
+"""
+
+_REVOKE_SESSIONS = LuaScript(_REVOKE_INDEXED + "return revoked\n")
+
+# KEYS: security stamp index, old refresh token family, new security stamp,
+#       new refresh token family
+# ARGV: invalidation channel, cache name, user id, security stamp ttl,
+#       refresh token ttl, new jti
+_RENEW_SESSIONS = LuaScript(
+    _REVOKE_INDEXED
+    + """
+redis.call('DEL', KEYS[2])
+redis.call('SET', KEYS[3], ARGV[3], 'EX', ARGV[4])
+redis.call('SET', KEYS[4], ARGV[6], 'EX', ARGV[5])
+redis.call('SADD', KEYS[1], KEYS[3], KEYS[4])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return revoked
+"""
+)
+
+
+def _security_stamp_key(user_id: UserId, security_stamp: str) -> str:
+    return f"security-stamp:{user_id}:{security_stamp}"
+
+
+def _security_stamp_index(user_id: UserId) -> str:
+    return f"security-stamps:{user_id}"
+
+
+def _refresh_token_key(family: str) -> str:
+    return f"refresh-token:{family}"
+
+
+async def issue_session(
+    redis: Redis, user_id: UserId, security_stamp: str, family: str, jti: str
+) -> None:
+    await _ISSUE_SESSION(
+        redis,
+        [
+            _security_stamp_key(user_id, security_stamp),
+            _security_stamp_index(user_id),
+            _refresh_token_key(family),
+        ],
+        [
+            str(user_id),
+            auth_config.ACCESS_TOKEN_LIFE_TIME_MINUTE * 60,
+            auth_config.REFRESH_TOKEN_LIFE_TIME_MINUTE * 60,
+            jti,
+        ],
+    )
+
+
+async def rotate_refresh_token(
+    redis: Redis,
+    cache_name: str,
+    user_id: UserId,
+    security_stamp: str,
+    family: str,
+    jti: str,
+    new_jti: str,
+) -> bool:
+    """
+    Returns False when the family is unknown or `jti` is not its latest token.
+    The latter revokes the family.
+    """
+    security_stamp_key = _security_stamp_key(user_id, security_stamp)
+    rotated = await _ROTATE_REFRESH_TOKEN(
+        redis,
+        [
+            _refresh_token_key(family),
+            security_stamp_key,
+            _security_stamp_index(user_id),
+        ],
+        [
+            str(user_id),
+            auth_config.ACCESS_TOKEN_LIFE_TIME_MINUTE * 60,
+            auth_config.REFRESH_TOKEN_LIFE_TIME_MINUTE * 60,
+            jti,
+            new_jti,
+            INVALIDATION_CHANNEL,
+            cache_name,
+        ],
+    )
+    if rotated == -1:
+        logger.warning(f"Refresh token reuse detected for user {user_id}.")
+        invalidate_locally(cache_name, security_stamp_key)
+    return rotated == 1
+
+
+async def end_session(
+    redis: Redis,
+    cache_name: str,
+    user_id: UserId,
+    security_stamp: str,
+    family: str,
+) -> None:
+    security_stamp_key = _security_stamp_key(user_id, security_stamp)
+    invalidate_locally(cache_name, security_stamp_key)
+    await _END_SESSION(
+        redis,
+        [
+            _refresh_token_key(family),
+            security_stamp_key,
+            _security_stamp_index(user_id),
+        ],
+        [INVALIDATION_CHANNEL, cache_name],
+    )
+
+
+async def revoke_sessions(redis: Redis, cache_name: str, user_id: UserId) -> None:
+    revoked = await _REVOKE_SESSIONS(
+        redis, [_security_stamp_index(user_id)], [INVALIDATION_CHANNEL, cache_name]
+    )
+    invalidate_locally(cache_name, *revoked)
+
+
+async def renew_sessions(
+    redis: Redis,
+    cache_name: str,
+    user_id: UserId,
+    family: str,
+    new_security_stamp: str,
+    new_family: str,
+    new_jti: str,
+) -> None:
+    """Revokes every session of the user and issues the new one."""
+    revoked = await _RENEW_SESSIONS(
+        redis,
+        [
+            _security_stamp_index(user_id),
+            _refresh_token_key(family),
+            _security_stamp_key(user_id, new_security_stamp),
+            _refresh_token_key(new_family),
+        ],
+        [
+            INVALIDATION_CHANNEL,
+            cache_name,
+            str(user_id),
+            auth_config.ACCESS_TOKEN_LIFE_TIME_MINUTE * 60,
+            auth_config.REFRESH_TOKEN_LIFE_TIME_MINUTE * 60,
+            new_jti,
+        ],
+    )
+    invalidate_locally(cache_name, *revoked)
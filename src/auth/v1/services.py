@@ -1,89 +1,98 @@
+import contextlib
+import hashlib
 import logging
-from typing import assert_never
+from typing import Any, assert_never
 
 from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
-from fastapi import HTTPException
+from fastapi import BackgroundTasks, HTTPException
 
 from src.auth.v1 import schemas
 from src.auth.v1 import types
 from src.auth.v1 import repositories
 from src.auth.v1 import exceptions
 from src.auth.v1 import utils
-from src.auth.v1.dependencies import decode_refresh_token
+from src.auth.v1 import scripts
+from src.auth.v1.dependencies import (
+    TokenPayload,
+    _decode_token,
+    check_security_stamps,
+    decode_refresh_token,
+    identity_filter,
+    invalidate_principal,
+    security_stamp_cache,
+)
 from src.auth.v1.config import auth_config
-from src.providers.v1 import repositories as provider_repositories
-from src.providers.v1.types import ProviderId
+from src.providers.v1.dependencies import get_staff_permissions
+from src.notifications.v1.repositories import enqueue_notification
+from src.notifications.v1.types import NotificationChannel
 from src.common.exceptions import CheckDbConnection
-from src.common.repositories import (
-    set_key_to_cache,
-    get_del_cached_value,
-    del_cache_key_by_regex_pattern,
-)
+from src.common.rate_limit import Bucket, take_token
 
 logger = logging.getLogger("auth")
 
 
+async def _permission_claims(
+    session_maker: async_sessionmaker[AsyncSession], redis: Redis, user_id: types.UserId
+) -> dict[str, Any]:
+    """Keyword arguments of `utils.encode_token` embedding staff permissions."""
+    if not auth_config.EMBED_PERMISSION_CLAIMS:
+        return {}
+    permissions = await get_staff_permissions(session_maker, redis, user_id)
+    if permissions is None:
+        return {}
+    return {
+        "provider_id": permissions["provider_id"],
+        "is_founder": permissions["is_founder"],
+        "permission_mask": permissions["mask"],
+    }
+
+
 async def register(
     session_maker: async_sessionmaker[AsyncSession],
     redis: Redis,
     payload: schemas.RegisterIn,
 ) -> None:
     try:
+        # Hashing before the transaction so no connection is held while bcrypt runs.
+        hashed_password = await utils.async_hash_password(payload.password)
+        if payload.is_provider:
+            assert (
+                payload.company_name is not None
+            )  # Because of validator layer on top of schemas.
         async with session_maker.begin() as session:
-            user_id: (
-                types.UserId | None
-            ) = await repositories.get_user_id_by_identity_value(
-                session, payload.identity_value
-            )
-            match payload.identity_type:
-                case types.IdentityType.EMAIL:
-                    if user_id:
-                        raise exceptions.DuplicateEmailExc
-                case types.IdentityType.PHONE_NUMBER:
-                    if user_id:
-                        raise exceptions.DuplicatePhoneNumberExc
-                case _:
-                    assert_never(payload.identity_type)
-            user_id = await repositories.create_user(  # Side effects: CheckDbConnection
+            user_id, conflict = await repositories.register_user(
                 session,
-                utils.hash_password(payload.password),
-                True if payload.is_provider else False,
-            )
-            await repositories.create_user_identity(
-                db_session=session,
-                user_id=user_id,
+                hashed_password=hashed_password,
                 identity_type=payload.identity_type,
                 identity_value=payload.identity_value,
                 full_name=payload.full_name,
                 username=payload.username,
                 avatar=payload.avatar,
+                company_name=payload.company_name if payload.is_provider else None,
             )
-            if payload.is_provider:
-                assert (
-                    payload.company_name is not None
-                )  # Because of validator layer on top of schemas.
-                provider_id: (
-                    ProviderId | None
-                ) = await provider_repositories.create_provider(
-                    session, payload.company_name
-                )
-                if not provider_id:
-                    raise CheckDbConnection
-                await provider_repositories.create_provider_staff(
-                    db_session=session,
-                    provider_id=provider_id,
-                    user_id=user_id,
-                    is_founder=True,
-                )
-        verification_code = utils.generate_random_code(6)
-        await set_key_to_cache(
-            redis=redis,
-            name=f"verification-code:{verification_code}",
-            value=str(user_id),
-            ex=auth_config.VERIFY_ACCOUNT_MESSAGE_LIFETIME_SEC,
-        )
-        # TODO: Sending email or sms in production mode.
+            # Raising rolls back whatever part of the registration was inserted.
+            match conflict:
+                case None:
+                    pass
+                case types.RegistrationConflict.IDENTITY:
+                    if payload.identity_type == types.IdentityType.EMAIL:
+                        raise exceptions.DuplicateEmailExc
+                    raise exceptions.DuplicatePhoneNumberExc
+                case types.RegistrationConflict.COMPANY_NAME:
+                    raise exceptions.DuplicateCompanyNameExc
+                case _:
+                    assert_never(conflict)
+            # Signed instead of stored, so unverified users cost no Redis memory.
+            await _notify(
+                session,
+                payload.identity_type,
+                payload.identity_value,
+                utils.encode_activation_token(user_id),
+            )
+        # Only once committed: added earlier, the value would be missed for good
+        # by a rebuild whose snapshot of the table precedes the commit.
+        await _add_to_identity_filter(redis, payload.identity_value)
 
     except exceptions.DuplicateEmailExc as ex:
         logger.info(ex)
@@ -93,27 +102,68 @@ async def register(
         logger.info(ex)
         raise ex
 
+    except exceptions.DuplicateCompanyNameExc as ex:
+        logger.info(ex)
+        raise ex
+
+    except exceptions.PasswordHasherBusyExc as ex:
+        logger.warning(ex)
+        raise ex
+
     except Exception as ex:
-        if "uq_providers_name" in str(ex):
-            logger.info(ex)
-            raise exceptions.DuplicateCompanyNameExc
         logger.exception(ex)
         raise CheckDbConnection
 
 
+async def _add_to_identity_filter(redis: Redis, identity_value: str) -> None:
+    try:
+        await identity_filter.add(redis, identity_value)
+    except Exception as ex:
+        logger.error(ex)
+        # A filter missing the value would reject the user as unknown, while
+        # an unbuilt one lets every value through until it is rebuilt.
+        with contextlib.suppress(Exception):
+            await identity_filter.drop(redis)
+
+
+async def _notify(
+    session: AsyncSession,
+    identity_type: types.IdentityType,
+    identity_value: str,
+    body: str,
+) -> None:
+    """Writes to the outbox in the caller's transaction; the worker sends it."""
+    match identity_type:
+        case types.IdentityType.EMAIL:
+            channel = NotificationChannel.EMAIL
+        case types.IdentityType.PHONE_NUMBER:
+            channel = NotificationChannel.SMS
+        case _:
+            assert_never(identity_type)
+    await enqueue_notification(session, channel, identity_value, body)
+
+
 async def activate_account(
     session_maker: async_sessionmaker[AsyncSession],
     redis: Redis,
     verification_code: str,
 ) -> None:
-    user_id = await get_del_cached_value(
-        redis=redis, name=f"verification-code:{verification_code}"
-    )
+    verified = utils.verify_activation_token(verification_code)
     try:
-        if user_id is None:
+        if verified is None:
             raise exceptions.InvalidVerificationCodeExc
-        async with session_maker.begin() as session:
-            await repositories.activate_user_account(session, types.UserId(user_id))
+        user_id, expire = verified
+        # Single use: used tokens are denylisted until they would expire anyway.
+        used_key = f"used-activation-token:{verification_code.rsplit('.', 1)[1]}"
+        if not await redis.set(used_key, 1, nx=True, exat=expire + 1):
+            raise exceptions.InvalidVerificationCodeExc
+        try:
+            async with session_maker.begin() as session:
+                await repositories.activate_user_account(session, user_id)
+        except Exception:
+            await redis.delete(used_key)
+            raise
+        await invalidate_principal(redis, user_id)
 
     except exceptions.InvalidVerificationCodeExc as ex:
         logger.info(ex)
@@ -129,6 +179,8 @@ async def resend_verification_code(
     redis: Redis,
     payload: schemas.IdentityValueIn,
 ):
+    if not await identity_filter.might_contain(redis, payload.identity_value):
+        raise exceptions.AccountDoesntExistExc
     async with session_maker.begin() as session:
         user_info: (
             tuple[types.UserId, bool] | None
@@ -138,84 +190,127 @@ async def resend_verification_code(
             identity_value=payload.identity_value,
         )
         if user_info is None:
+            identity_filter.record_false_positive()
             raise exceptions.AccountDoesntExistExc
         elif user_info[1] is True:
             raise exceptions.AccountAlreadyActivatedExc
         else:
-            verification_code = utils.generate_random_code(6)
-            await set_key_to_cache(
-                redis,
-                f"verification-code:{verification_code}",
-                str(user_info[0]),
-                ex=auth_config.VERIFY_ACCOUNT_MESSAGE_LIFETIME_SEC,
+            await _notify(
+                session,
+                payload.identity_type(),
+                payload.identity_value,
+                utils.encode_activation_token(user_info[0]),
+            )
+
+
+async def _throttle_login(redis: Redis, username: str, client_ip: str) -> None:
+    """
+    Runs before any query or hash, so rejected attempts cost one Redis call.
+    The identity bucket slows guessing one account from many addresses, the
+    address bucket one client trying many accounts.
+    """
+    identity = hashlib.sha256(username.lower().encode()).hexdigest()
+    retry_after = await take_token(
+        redis,
+        Bucket(
+            f"login-attempts:identity:{identity}",
+            auth_config.LOGIN_ATTEMPTS_PER_IDENTITY,
+            auth_config.LOGIN_IDENTITY_REFILL_SEC,
+        ),
+        Bucket(
+            f"login-attempts:ip:{client_ip}",
+            auth_config.LOGIN_ATTEMPTS_PER_IP,
+            auth_config.LOGIN_IP_REFILL_SEC,
+        ),
+    )
+    if retry_after:
+        raise exceptions.TooManyLoginAttemptsExc(retry_after)
+
+
+async def _rehash_password(
+    session_maker: async_sessionmaker[AsyncSession],
+    user_id: types.UserId,
+    password: str,
+    old_hashed_password: str,
+) -> None:
+    """Rehashes with the configured bcrypt cost, after the login response is sent."""
+    try:
+        new_hashed_password = await utils.async_hash_password(password)
+        async with session_maker.begin() as session:
+            await repositories.replace_password_hash(
+                session, user_id, old_hashed_password, new_hashed_password
             )
-            match payload.identity_type:
-                case types.IdentityType.EMAIL:
-                    utils.send_email(
-                        verification_code
-                    )  # TODO: Sending email in production mode.
-                case types.IdentityType.PHONE_NUMBER:
-                    utils.send_sms(
-                        verification_code
-                    )  # TODO: Sending SMS in production mode.
+
+    except exceptions.PasswordHasherBusyExc:
+        pass  # Retried on the next login.
+
+    except Exception as ex:
+        logger.warning(ex)
 
 
 async def login(
     session_maker: async_sessionmaker[AsyncSession],
     redis: Redis,
+    background_tasks: BackgroundTasks,
     username: str,
     password: str,
+    client_ip: str,
 ) -> schemas.Token:
     try:
+        await _throttle_login(redis, username, client_ip)
+        if not await identity_filter.might_contain(redis, username):
+            raise exceptions.InvalidCredentialsExc
+        # Only the lookup runs in the transaction, so no connection is held
+        # while bcrypt runs or while the permission claims are resolved.
         async with session_maker.begin() as session:
             user_info = await repositories.get_user_credentials_by_identity_value(
                 session, username
             )
-            if not user_info:
-                raise exceptions.InvalidCredentialsExc
-
-            user_id, is_active, hashed_password, role = user_info
-            # if role == types.UserRole.SELLER:
-            #     raise exceptions.SellerAccountExc
-
-            if not utils.verify_password(password, hashed_password):
-                raise exceptions.InvalidCredentialsExc
-
-            elif is_active is False:
-                raise exceptions.AccountNotActiveExc
-
-            else:
-                # Generating security stamp, storing it in cache and decoding it into the access token.
-                security_stamp = utils.generate_security_stamp()
-                await set_key_to_cache(
-                    redis,
-                    f"security-stamp:{user_id}:{security_stamp}",
-                    str(user_id),
-                    auth_config.ACCESS_TOKEN_LIFE_TIME_MINUTE * 60,
-                )
-                access_token = await utils.encode_token(
-                    token_type="access_token",
-                    user_id=user_id,
-                    security_stamp=security_stamp,
-                    role=role,
-                )
+        if not user_info:
+            identity_filter.record_false_positive()
+            raise exceptions.InvalidCredentialsExc
 
-                refresh_token = await utils.encode_token(
-                    token_type="refresh_token",
-                    user_id=user_id,
-                    security_stamp=security_stamp,
-                    role=role,
-                )
-                # Whitelisting valid refresh tokens
-                await set_key_to_cache(
-                    redis,
-                    refresh_token,
-                    str(user_id),
-                    auth_config.REFRESH_TOKEN_LIFE_TIME_MINUTE * 60,
-                )
-                return schemas.Token(
-                    access_token=access_token, refresh_token=refresh_token
+        user_id, is_active, hashed_password, role = user_info
+        # if role == types.UserRole.SELLER:
+        #     raise exceptions.SellerAccountExc
+
+        if not await utils.async_verify_password(password, hashed_password):
+            raise exceptions.InvalidCredentialsExc
+
+        elif is_active is False:
+            raise exceptions.AccountNotActiveExc
+
+        else:
+            if utils.password_needs_rehash(hashed_password):
+                background_tasks.add_task(
+                    _rehash_password,
+                    session_maker,
+                    user_id,
+                    password,
+                    hashed_password,
                 )
+            # Generating security stamp, storing it in cache and decoding it into the access token.
+            security_stamp = utils.generate_security_stamp()
+            access_token = await utils.encode_token(
+                token_type="access_token",
+                user_id=user_id,
+                security_stamp=security_stamp,
+                role=role,
+                **await _permission_claims(session_maker, redis, user_id),
+            )
+
+            family, jti = utils.generate_token_id(), utils.generate_token_id()
+            refresh_token = await utils.encode_token(
+                token_type="refresh_token",
+                user_id=user_id,
+                security_stamp=security_stamp,
+                role=role,
+                jti=jti,
+                family=family,
+            )
+            # Storing the security stamp and whitelisting the refresh token at once.
+            await scripts.issue_session(redis, user_id, security_stamp, family, jti)
+            return schemas.Token(access_token=access_token, refresh_token=refresh_token)
 
     except exceptions.InvalidCredentialsExc as ex:
         logger.info(ex)
@@ -225,66 +320,84 @@ async def login(
         logger.info(ex)
         raise ex
 
+    except exceptions.PasswordHasherBusyExc as ex:
+        logger.warning(ex)
+        raise ex
+
+    except exceptions.TooManyLoginAttemptsExc as ex:
+        logger.info(ex)
+        raise ex
+
     except Exception as ex:
         logger.warning(ex)
         raise CheckDbConnection
 
 
-async def get_refresh_token(redis: Redis, refresh_token: str | None) -> schemas.Token:
+async def get_refresh_token(
+    session_maker: async_sessionmaker[AsyncSession],
+    redis: Redis,
+    refresh_token: str | None,
+) -> schemas.Token:
     try:
-        if (
-            not refresh_token
-            or await get_del_cached_value(redis, refresh_token) is None
-        ):
+        if not refresh_token:
             raise exceptions.InvalidTokenExc
         payload = decode_refresh_token(refresh_token)
-        # Generating security stamp, storing it in cache and decoding it into the access token.
-        await set_key_to_cache(
-            redis,
-            f"security-stamp:{payload['user_id']}:{payload['security_stamp']}",
-            str(payload["user_id"]),
-            auth_config.ACCESS_TOKEN_LIFE_TIME_MINUTE * 60,
-        )
+        if "jti" not in payload or "fam" not in payload:
+            raise exceptions.InvalidTokenExc
         access_token = await utils.encode_token(
             token_type="access_token",
             user_id=payload["user_id"],
             security_stamp=payload["security_stamp"],
             role=payload["role"],
+            **await _permission_claims(session_maker, redis, payload["user_id"]),
         )
 
-        # Generating new refresh token and storing it in cache.
+        # Generating new refresh token of the same family and storing it in cache.
+        new_jti = utils.generate_token_id()
         new_refresh_token = await utils.encode_token(
             token_type="refresh_token",
             user_id=payload["user_id"],
             security_stamp=payload["security_stamp"],
             role=payload["role"],
+            jti=new_jti,
+            family=payload["fam"],
         )
-        # Whitelisting valid refresh tokens
-        await set_key_to_cache(
+        # Swapping the whitelisted refresh token and storing the security stamp at once.
+        if not await scripts.rotate_refresh_token(
             redis,
-            new_refresh_token,
-            str(payload["user_id"]),
-            auth_config.REFRESH_TOKEN_LIFE_TIME_MINUTE * 60,
-        )
+            security_stamp_cache.name,
+            payload["user_id"],
+            payload["security_stamp"],
+            payload["fam"],
+            payload["jti"],
+            new_jti,
+        ):
+            raise exceptions.InvalidTokenExc
         return schemas.Token(access_token=access_token, refresh_token=new_refresh_token)
 
     except exceptions.InvalidTokenExc as ex:
         logger.warning(ex)
         raise ex
 
+    except exceptions.ExpiredTokenExc as ex:
+        logger.info(ex)
+        raise ex
+
     except Exception as ex:
         logger.warning(ex)
         raise CheckDbConnection
 
 
 async def logout(redis: Redis, refresh_token: str) -> None:
-    await get_del_cached_value(
-        redis, refresh_token
-    )  # Deleting refresh token from cache.
     payload = decode_refresh_token(refresh_token)
-    await get_del_cached_value(
-        redis, f"security-stamp:{payload['user_id']}:{payload['security_stamp']}"
-    )  # Deleting security stamp from cache.
+    # Deleting refresh token and security stamp from cache.
+    await scripts.end_session(
+        redis,
+        security_stamp_cache.name,
+        payload["user_id"],
+        payload["security_stamp"],
+        payload.get("fam", ""),
+    )
 
 
 async def reset_password(
@@ -293,6 +406,8 @@ async def reset_password(
     payload: schemas.IdentityValueIn,
 ) -> None:
     try:
+        if not await identity_filter.might_contain(redis, payload.identity_value):
+            raise exceptions.AccountDoesntExistExc
         async with session_maker.begin() as session:
             user_id: (
                 types.UserId | None
@@ -300,30 +415,28 @@ async def reset_password(
                 session, payload.identity_value
             )
             if not user_id:
+                identity_filter.record_false_positive()
                 raise exceptions.AccountDoesntExistExc
             new_password = utils.generate_random_code(8)
-            new_hashed_password = utils.hash_password(new_password)
+            new_hashed_password = await utils.async_hash_password(new_password)
             await repositories.update_user_password(
                 session, user_id, new_hashed_password
             )
-            match payload.identity_type():
-                case types.IdentityType.EMAIL:
-                    utils.send_email(new_password)
-                case types.IdentityType.PHONE_NUMBER:
-                    utils.send_sms(new_password)
-                case _:
-                    assert_never(payload.identity_type())
-
-            # Deleting security stamp from cache.
-            await del_cache_key_by_regex_pattern(
-                redis,
-                f"security-stamp:{user_id}:*",
+            await _notify(
+                session, payload.identity_type(), payload.identity_value, new_password
             )
 
+            # Deleting security stamps from cache.
+            await scripts.revoke_sessions(redis, security_stamp_cache.name, user_id)
+
     except exceptions.AccountDoesntExistExc as ex:
         logger.info(ex)
         raise ex
 
+    except exceptions.PasswordHasherBusyExc as ex:
+        logger.warning(ex)
+        raise ex
+
     except Exception as ex:
         logger.warning(ex)
         raise CheckDbConnection
@@ -337,6 +450,9 @@ async def change_password(
     refresh_token: str,
 ) -> schemas.Token:
     try:
+        # Resolved before the transaction: on a cache miss the resolver takes
+        # a pooled connection of its own.
+        permission_claims = await _permission_claims(session_maker, redis, user_id)
         async with session_maker.begin() as session:
             hashed_password = await repositories.get_user_passwd_by_id(session, user_id)
             if not hashed_password:
@@ -345,52 +461,89 @@ async def change_password(
                     detail="Unexpected error",
                 )
 
-            if not utils.verify_password(payload.old_password, hashed_password):
+            if not await utils.async_verify_password(
+                payload.old_password, hashed_password
+            ):
                 raise exceptions.WrongOldPasswordExc
 
-            new_hashed_password = utils.hash_password(payload.new_password)
+            new_hashed_password = await utils.async_hash_password(payload.new_password)
             await repositories.update_user_password(
                 session, user_id, new_hashed_password
             )
 
             # Regenerating security stamp, storing it in cache, deleting previous security stamp and decoding it into the access token and refresh token.
-            await del_cache_key_by_regex_pattern(
-                redis,
-                f"security-stamp:{user_id}:*",
-            )
-            await get_del_cached_value(redis, refresh_token)
             new_security_stamp = utils.generate_security_stamp()
-            await set_key_to_cache(
-                redis,
-                f"security-stamp:{user_id}:{new_security_stamp}",
-                str(user_id),
-                auth_config.ACCESS_TOKEN_LIFE_TIME_MINUTE * 60,
-            )
             decoded_refresh_token = decode_refresh_token(refresh_token)
             access_token = await utils.encode_token(
                 token_type="access_token",
                 user_id=user_id,
                 security_stamp=new_security_stamp,
                 role=decoded_refresh_token["role"],
+                **permission_claims,
             )
-            refresh_token = await utils.encode_token(
+            new_family, new_jti = utils.generate_token_id(), utils.generate_token_id()
+            new_refresh_token = await utils.encode_token(
                 token_type="refresh_token",
                 user_id=user_id,
                 security_stamp=new_security_stamp,
                 role=decoded_refresh_token["role"],
+                jti=new_jti,
+                family=new_family,
             )
-            await set_key_to_cache(
+            await scripts.renew_sessions(
                 redis,
-                refresh_token,
-                str(user_id),
-                auth_config.REFRESH_TOKEN_LIFE_TIME_MINUTE * 60,
+                security_stamp_cache.name,
+                user_id,
+                decoded_refresh_token.get("fam", ""),
+                new_security_stamp,
+                new_family,
+                new_jti,
+            )
+            return schemas.Token(
+                access_token=access_token, refresh_token=new_refresh_token
             )
-            return schemas.Token(access_token=access_token, refresh_token=refresh_token)
 
     except exceptions.WrongOldPasswordExc as ex:
         logger.info(ex)
         raise ex
 
+    except exceptions.PasswordHasherBusyExc as ex:
+        logger.warning(ex)
+        raise ex
+
     except Exception as ex:
         logger.warning(ex)
         raise CheckDbConnection
+
+
+async def introspect_tokens(
+    redis: Redis, tokens: list[str]
+) -> schemas.IntrospectBatchOut:
+    results: list[schemas.IntrospectionResult | None] = []
+    payloads: list[TokenPayload] = []
+    for token in tokens:
+        try:
+            payloads.append(_decode_token(token))
+            results.append(None)
+        except (exceptions.InvalidTokenExc, exceptions.ExpiredTokenExc) as ex:
+            results.append(schemas.IntrospectionResult(active=False, detail=ex.detail))
+
+    # Every security stamp is checked with a single MGET.
+    valid = iter(await check_security_stamps(redis, payloads))
+    payload_iter = iter(payloads)
+    for index, result in enumerate(results):
+        if result is not None:
+            continue
+        payload = next(payload_iter)
+        if next(valid):
+            results[index] = schemas.IntrospectionResult(
+                active=True,
+                user_id=payload["user_id"],
+                role=payload["role"],
+                exp=payload["exp"],
+            )
+        else:
+            results[index] = schemas.IntrospectionResult(
+                active=False, detail=exceptions.SecurityStampChangedExc().detail
+            )
+    return schemas.IntrospectBatchOut(results=results)  # type: ignore[arg-type]
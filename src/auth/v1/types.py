@@ -17,3 +17,8 @@ class UserRole(StrEnum):
 class IdentityType(StrEnum):
     EMAIL = auto()
     PHONE_NUMBER = auto()
+
+
+class RegistrationConflict(StrEnum):
+    IDENTITY = auto()
+    COMPANY_NAME = auto()
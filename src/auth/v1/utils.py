@@ -1,18 +1,31 @@
+import asyncio
+import base64
+import hashlib
+import hmac
 import logging
 import secrets
-from typing import Literal
-from uuid import uuid4
+import time
+from typing import Any, Callable, Literal
+from uuid import UUID, uuid4
 from datetime import datetime, timezone, timedelta
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 
 import jwt
 from passlib.context import CryptContext  # type: ignore
 
+from src.auth.v1 import exceptions
 from src.auth.v1.types import UserId, UserRole
+from src.providers.v1.types import ProviderId
 from src.auth.v1.config import auth_config
+from src.auth.v1.keys import get_key_set
+from src.common.utils import TimingStats
+from src.common import metrics
 
 logger = logging.getLogger("auth")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=auth_config.BCRYPT_ROUNDS
+)
 
 
 def hash_password(password: str) -> str:
@@ -23,6 +36,110 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True for hashes made with another cost than BCRYPT_ROUNDS. Doesn't hash."""
+    return pwd_context.needs_update(hashed_password)
+
+
+def _timed_call(func: Callable[..., Any], *args: Any) -> tuple[Any, float]:
+    # Runs inside the worker so the measured time excludes queueing.
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt off the event loop on a bounded executor.
+    Once `max_pending` jobs are queued or running, new jobs are rejected
+    instead of piling up behind the workers.
+    """
+
+    def __init__(
+        self,
+        executor_type: Literal["thread", "process"],
+        max_workers: int | None,
+        max_pending: int,
+    ) -> None:
+        self.executor_type = executor_type
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.queue_wait = TimingStats()
+        self.hash_time = TimingStats()
+        self._executor: Executor | None = None
+
+    def start(self) -> None:
+        if self._executor is not None:
+            return
+        if self.executor_type == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="password-hasher"
+            )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, operation: str, func: Callable[..., Any], *args: Any) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            metrics.password_hash_rejected.inc()
+            raise exceptions.PasswordHasherBusyExc
+        self.start()  # No-op once the lifespan has started the executor.
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            result, hash_time = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _timed_call, func, *args
+            )
+        finally:
+            self.pending -= 1
+        queue_wait = max(time.perf_counter() - start - hash_time, 0.0)
+        self.hash_time.record(hash_time)
+        self.queue_wait.record(queue_wait)
+        metrics.password_hash_duration.labels(operation).observe(hash_time)
+        metrics.password_hash_queue_wait.labels(operation).observe(queue_wait)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(
+            "verify", verify_password, plain_password, hashed_password
+        )
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "executor": self.executor_type,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "queue_wait": self.queue_wait.snapshot(),
+            "hash_time": self.hash_time.snapshot(),
+        }
+
+
+password_hasher = PasswordHasher(
+    executor_type=auth_config.PASSWORD_HASHER_EXECUTOR,
+    max_workers=auth_config.PASSWORD_HASHER_MAX_WORKERS,
+    max_pending=auth_config.PASSWORD_HASHER_MAX_PENDING,
+)
+
+
+async def async_hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
+
+
+async def async_verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
+
+
 def generate_random_code(length: int) -> str:
     return str(int(uuid4()))[:length]
 
@@ -31,12 +148,53 @@ def generate_security_stamp() -> str:
     return secrets.token_urlsafe(8)
 
 
-def send_sms(content: str):
-    logger.critical(f"Sending sms. {content}")
+def generate_token_id() -> str:
+    return secrets.token_urlsafe(12)
+
+
+def _sign_activation(message: str) -> str:
+    # Prefixed so an activation signature can never be valid anywhere else.
+    digest = hmac.new(
+        auth_config.SECRET_KEY.encode(),
+        f"activate-account:{message}".encode(),
+        hashlib.sha256,
+    ).digest()
+    return base64.urlsafe_b64encode(digest[:16]).rstrip(b"=").decode()
+
+
+def encode_activation_token(user_id: UserId) -> str:
+    """
+    `{user_id hex}.{expiry timestamp}.{signature}`, verified without any
+    state by `verify_activation_token`.
+    """
+    expire = int(time.time()) + auth_config.VERIFY_ACCOUNT_MESSAGE_LIFETIME_SEC
+    message = f"{user_id.hex}.{expire}"
+    return f"{message}.{_sign_activation(message)}"
+
+
+def verify_activation_token(token: str) -> tuple[UserId, int] | None:
+    """Returns the user id and expiry timestamp of a valid, unexpired token."""
+    try:
+        user_id, expire, signature = token.split(".")
+        message = f"{user_id}.{expire}"
+        if not hmac.compare_digest(signature, _sign_activation(message)):
+            return None
+        if int(expire) < time.time():
+            return None
+        return UserId(UUID(hex=user_id)), int(expire)
+    except ValueError:
+        return None
+
+
+def encode_permission_mask(mask: int) -> str:
+    """Base64url (unpadded) of the big endian bytes of `mask`."""
+    raw = mask.to_bytes((mask.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
 
 
-def send_email(content: str):
-    logger.critical(f"Sending email. {content}")
+def decode_permission_mask(encoded: str) -> int:
+    raw = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+    return int.from_bytes(raw, "big")
 
 
 async def encode_token(
@@ -44,7 +202,18 @@ async def encode_token(
     user_id: UserId,
     security_stamp: str | None,
     role: UserRole,
+    jti: str | None = None,
+    family: str | None = None,
+    provider_id: ProviderId | None = None,
+    is_founder: bool = False,
+    permission_mask: int = 0,
 ) -> str:
+    """
+    Refresh tokens carry `jti` and `family` (`fam` claim); rotating a refresh
+    token keeps the family and issues a new jti.
+    Tokens of provider staff may carry `pid`, `fnd` and `perms` claims so
+    permissions can be checked without any lookup.
+    """
     if security_stamp is None:
         security_stamp = generate_security_stamp()
 
@@ -59,6 +228,20 @@ async def encode_token(
         "role": str(role),
         "exp": expire,
     }
+    if jti is not None:
+        payload["jti"] = jti
+    if family is not None:
+        payload["fam"] = family
+    if provider_id is not None:
+        payload["pid"] = str(provider_id)
+        if is_founder:
+            payload["fnd"] = True
+        elif permission_mask:
+            payload["perms"] = encode_permission_mask(permission_mask)
+    key_set = get_key_set()
     return jwt.encode(
-        payload, auth_config.SECRET_KEY, algorithm=auth_config.JWT_ALGORITHM
+        payload,
+        key_set.signing_key,
+        algorithm=auth_config.JWT_ALGORITHM,
+        headers=key_set.headers(),
     )
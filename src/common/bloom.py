@@ -0,0 +1,135 @@
+"""
+Bloom filters stored in Redis bitmaps.
+
+A filter answers "definitely absent" or "maybe present" for a value, so
+lookups of absent values can skip the database. It only exists once built
+from the source of truth with `rebuild`; until then, and whenever its key
+is lost, every value is "maybe present".
+
+`rebuild` fills a new bitmap and renames it over the live one. Values added
+meanwhile go to both, so none is missed as long as values are only added
+once committed to the source of truth: the new bitmap exists before it is
+read, so every value is either in the snapshot or added to both. The size
+and hash count are part of the key, so resizing the filter starts from an
+empty (unbuilt) one.
+"""
+
+import hashlib
+import math
+from typing import Any, AsyncIterable
+
+from redis.asyncio import Redis
+
+from src.common.repositories import LuaScript
+
+# KEYS: filters to add to, skipped unless they exist
+# ARGV: bit offsets
+_ADD = LuaScript(
+    """
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        for _, offset in ipairs(ARGV) do
+            redis.call('SETBIT', key, offset, 1)
+        end
+    end
+end
+return 1
+"""
+)
+
+# KEYS: filter
+# ARGV: bit offsets of the value
+# Returns 0 when the value is absent, 1 when it may be present, 2 when the
+# filter isn't built.
+_CONTAINS = LuaScript(
+    """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 2
+end
+for _, offset in ipairs(ARGV) do
+    if redis.call('GETBIT', KEYS[1], offset) == 0 then
+        return 0
+    end
+end
+return 1
+"""
+)
+
+
+class BloomFilter:
+    def __init__(self, name: str, capacity: int, error_rate: float) -> None:
+        # Optimal bit count and hash count for `capacity` values.
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.key = f"bloom:{name}:{self.size}:{self.hashes}"
+        self.ready = False  # As of the last lookup.
+        self.checks = 0
+        self.definite_misses = 0
+        self.false_positives = 0
+
+    def _offsets(self, value: str) -> list[int]:
+        # Double hashing: k offsets out of one 128 bit digest.
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    async def add(self, redis: Redis, *values: str) -> None:
+        offsets = [offset for value in values for offset in self._offsets(value)]
+        await _ADD(redis, [self.key, f"{self.key}:rebuild"], offsets)
+
+    async def might_contain(self, redis: Redis, value: str) -> bool:
+        found = await _CONTAINS(redis, [self.key], self._offsets(value))
+        self.ready = found != 2
+        if not self.ready:
+            return True
+        self.checks += 1
+        if found:
+            return True
+        self.definite_misses += 1
+        return False
+
+    def record_false_positive(self) -> None:
+        """Called when a value the filter might contain turns out absent."""
+        if self.ready:
+            self.false_positives += 1
+
+    async def drop(self, redis: Redis) -> None:
+        """Makes the filter unbuilt, e.g. when a value may have been missed."""
+        await redis.delete(self.key)
+
+    async def rebuild(self, redis: Redis, batches: AsyncIterable[list[str]]) -> int:
+        """
+        `batches` must not query the source of truth before it is iterated,
+        so its snapshot is taken once the new bitmap receives added values.
+        """
+        staging = f"{self.key}:rebuild"
+        await redis.delete(staging)
+        await redis.setbit(staging, self.size - 1, 0)  # Allocates the bitmap.
+        added = 0
+        async for values in batches:
+            offsets = [offset for value in values for offset in self._offsets(value)]
+            await _ADD(redis, [staging], offsets)
+            added += len(values)
+        await redis.rename(staging, self.key)
+        return added
+
+    async def stats(self, redis: Redis) -> dict[str, Any]:
+        bits_set = await redis.bitcount(self.key)
+        checked_absent = self.definite_misses + self.false_positives
+        return {
+            "ready": bool(await redis.exists(self.key)),
+            "size_bits": self.size,
+            "hashes": self.hashes,
+            "bits_set": bits_set,
+            # Chance that all the bits of an absent value are set.
+            "estimated_fp_rate": round((bits_set / self.size) ** self.hashes, 6),
+            "checks": self.checks,
+            "definite_misses": self.definite_misses,
+            "false_positives": self.false_positives,
+            "observed_fp_rate": (
+                round(self.false_positives / checked_absent, 6)
+                if checked_absent
+                else 0.0
+            ),
+        }
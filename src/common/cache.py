@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from redis.asyncio import Redis
+
+logger = logging.getLogger("root")
+
+INVALIDATION_CHANNEL = "cache-invalidation"
+
+_caches: dict[str, "TTLCache"] = {}
+_listener: asyncio.Task | None = None
+
+
+class TTLCache:
+    """
+    Bounded in-process LRU cache.
+    Entries expire `ttl` seconds after being set, or earlier at `expires_at`.
+    Every cache registers itself under `name` so invalidations published by
+    other workers can reach it.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        _caches[name] = self
+
+    def get(self, key: Hashable) -> Any | None:
+        item = self._data.get(key)
+        if item is not None:
+            expires_at, value = item
+            if expires_at > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return None
+
+    def set(self, key: Hashable, value: Any, expires_at: float | None = None) -> None:
+        deadline = time.time() + self.ttl
+        if expires_at is not None and expires_at < deadline:
+            deadline = expires_at
+        self._data[key] = (deadline, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_sec": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def cache_stats() -> dict[str, dict[str, int | float]]:
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+def invalidate_locally(cache_name: str, *keys: str) -> None:
+    cache = _caches.get(cache_name)
+    if cache is None:
+        return
+    for key in keys:
+        cache.pop(key)
+
+
+def _invalidate(message: str) -> None:
+    # Messages are the cache name followed by the keys to drop, space separated.
+    cache_name, *keys = message.split(" ")
+    invalidate_locally(cache_name, *keys)
+
+
+async def publish_invalidation(redis: Redis, cache_name: str, *keys: str) -> None:
+    """
+    Drops `keys` from the local cache and tells every other worker to do the same.
+    Keys must not contain spaces.
+    """
+    if not keys:
+        return
+    invalidate_locally(cache_name, *keys)
+    await redis.publish(INVALIDATION_CHANNEL, " ".join((cache_name, *keys)))
+
+
+def _clear_all() -> None:
+    for cache in _caches.values():
+        cache.clear()
+
+
+async def _listen_for_invalidations(redis: Redis) -> None:
+    while True:
+        try:
+            async with redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                _clear_all()  # Invalidations sent while unsubscribed are lost.
+                async for message in pubsub.listen():
+                    data = message["data"]
+                    _invalidate(data.decode() if isinstance(data, bytes) else data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.warning(ex)
+            _clear_all()
+            await asyncio.sleep(1)
+
+
+def start_invalidation_listener(redis: Redis) -> None:
+    global _listener
+    if _listener is None:
+        _listener = asyncio.create_task(_listen_for_invalidations(redis))
+
+
+async def stop_invalidation_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+        _listener = None
@@ -0,0 +1,89 @@
+"""
+Logging off the event loop.
+
+Handlers configured by `LogConfig` (console, rotating file) format and
+write records on a `QueueListener` thread. Loggers only get a
+`DroppingQueueHandler`, which enqueues without blocking and counts the
+records dropped while the queue is full.
+"""
+
+import logging
+import queue
+from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+from src.config import LogConfig, settings
+
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.SimpleQueue, max_size: int) -> None:
+        super().__init__(log_queue)
+        self.log_queue = log_queue
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Arguments are merged now since they may change once the call returns.
+        # Formatting, tracebacks included, is left to the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # SimpleQueue is much cheaper than Queue; the bound is approximate.
+        if self.log_queue.qsize() >= self.max_size:
+            self.dropped += 1
+        else:
+            self.log_queue.put_nowait(record)
+
+
+_queue_handler: DroppingQueueHandler | None = None
+_listener: QueueListener | None = None
+
+
+def configure_logging(config: dict[str, Any] | None = None) -> None:
+    """
+    Applies `config` (`LogConfig` by default) at the environment's level,
+    behind a bounded queue.
+    """
+    global _queue_handler, _listener
+    stop_logging()
+    if config is None:
+        config = LogConfig().model_dump()
+    level = settings.log_level
+    for logger_config in config["loggers"].values():
+        logger_config["level"] = level
+    config["handlers"]["console"]["level"] = level
+    dictConfig(config)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _queue_handler = DroppingQueueHandler(log_queue, settings.LOG_QUEUE_MAX_SIZE)
+    handlers: dict[int, logging.Handler] = {}
+    for name in config["loggers"]:
+        logger = logging.getLogger(name)
+        for handler in logger.handlers:
+            handlers[id(handler)] = handler
+        logger.handlers = [_queue_handler]
+    _listener = QueueListener(log_queue, *handlers.values(), respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Flushes the queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def logging_stats() -> dict[str, Any]:
+    if _queue_handler is None:
+        return {}
+    return {
+        "queued": _queue_handler.queue.qsize(),  # type: ignore[attr-defined]
+        "max_size": _queue_handler.max_size,
+        "dropped": _queue_handler.dropped,
+    }
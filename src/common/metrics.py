@@ -0,0 +1,169 @@
+"""
+Prometheus metrics served by the `/metrics` route.
+
+Every uvicorn worker keeps its own values. To serve them summed over all
+workers, point `PROMETHEUS_MULTIPROC_DIR` at an empty directory shared by the
+workers (wiped before every start): each worker then writes its values to
+files there, and `/metrics` aggregates them whichever worker answers.
+"""
+
+import os
+import time
+from typing import Any, cast
+
+import redis.asyncio as redis
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from redis.asyncio.client import Pipeline
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.requests import Request
+from starlette.responses import Response
+
+from src.common import profiling
+
+# Finer than the defaults at the low end, where Redis and most queries land.
+_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)  # fmt: skip
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests, by route template.",
+    ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+password_hash_duration = Histogram(
+    "password_hash_duration_seconds",
+    "Time bcrypt spent hashing or verifying a password.",
+    ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.5),
+)
+password_hash_queue_wait = Histogram(
+    "password_hash_queue_wait_seconds",
+    "Time password hashing jobs waited for a free worker.",
+    ["operation"],
+    buckets=_LATENCY_BUCKETS,
+)
+password_hash_rejected = Counter(
+    "password_hash_rejected",
+    "Password hashing jobs rejected because too many were pending.",
+)
+redis_command_duration = Histogram(
+    "redis_command_duration_seconds",
+    "Round trip of Redis commands; a pipeline counts as one PIPELINE command.",
+    ["command"],
+    buckets=_LATENCY_BUCKETS,
+)
+db_pool_checkout_wait = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection of the database pool.",
+    buckets=_LATENCY_BUCKETS,
+)
+db_query_duration = Histogram(
+    "db_query_duration_seconds",
+    "Time spent executing database statements, by statement type.",
+    ["statement"],
+    buckets=_LATENCY_BUCKETS,
+)
+event_loop_lag = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop ran a task scheduled to wake up.",
+    buckets=_LATENCY_BUCKETS,
+)
+event_loop_blocked = Counter(
+    "event_loop_blocked",
+    "Calls that blocked the event loop longer than the monitor threshold.",
+)
+
+_STATEMENT_TYPES = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+
+def _statement_type(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement else ""
+    return keyword if keyword in _STATEMENT_TYPES else "OTHER"
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Records the duration of every statement executed through `engine`."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(
+        conn: Any, cursor: Any, statement: str, *args: Any
+    ) -> None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(
+        conn: Any, cursor: Any, statement: str, *args: Any
+    ) -> None:
+        duration = time.perf_counter() - conn.info["query_start"].pop()
+        db_query_duration.labels(_statement_type(statement)).observe(duration)
+        profiling.record_query(statement, duration)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context: Any) -> None:
+        # Failed statements never reach `after_cursor_execute`.
+        if context.connection is not None and context.connection.info.get(
+            "query_start"
+        ):
+            context.connection.info["query_start"].pop()
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True) -> list[Any]:
+        # The stack is reset once executed.
+        commands = [str(args[0]).upper() for args, _ in self.command_stack]
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            redis_command_duration.labels("PIPELINE").observe(
+                time.perf_counter() - start
+            )
+            profiling.record_redis_round_trip(*commands)
+
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client recording the round trip of every command."""
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            command = str(args[0]).upper()
+            redis_command_duration.labels(command).observe(time.perf_counter() - start)
+            profiling.record_redis_round_trip(command)
+
+    def pipeline(
+        self, transaction: bool = True, shard_hint: str | None = None
+    ) -> InstrumentedPipeline:
+        # The attribute is typed for both clients; this one always has an async pool.
+        return InstrumentedPipeline(
+            cast(redis.ConnectionPool, self.connection_pool),
+            self.response_callbacks,
+            transaction,
+            shard_hint,
+        )
+
+
+def mark_process_dead() -> None:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+async def metrics(_request: Request) -> Response:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,88 @@
+import time
+
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import JSONResponse
+from starlette.routing import BaseRoute
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.common.metrics import http_request_duration
+from src.common.profiling import RequestProfiler
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the latency of every HTTP request, labeled by the route template
+    (e.g. `/v1/admin/verify-provider/{provider_id}/`) so the label stays
+    bounded; requests matching no route share the `unmatched` label.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router adds the matched route to the scope it was given.
+            route: BaseRoute | None = scope.get("route")
+            http_request_duration.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status_code),
+            ).observe(time.perf_counter() - start)
+
+
+class ProfilingMiddleware:
+    """
+    Answers requests carrying the `X-Profile` header or the `profile` query
+    parameter with their profile (see `src.common.profiling`), the status and
+    body of the response included. Only added in debug environments.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        output = Headers(scope=scope).get("x-profile") or QueryParams(
+            scope["query_string"]
+        ).get("profile")
+        if output is None:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        body = bytearray()
+
+        async def capture(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                body.extend(message.get("body", b""))
+
+        with RequestProfiler(output) as profiler:
+            await self.app(scope, receive, capture)
+        report = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "status_code": status_code,
+            "response": body.decode(errors="replace"),
+            **profiler.report(),
+        }
+        await JSONResponse(report)(scope, receive, send)
@@ -0,0 +1,124 @@
+"""
+Event loop lag and blocking call detection.
+
+A heartbeat task sleeps `interval` seconds in a loop and records how late it
+wakes up. A watchdog thread checks the heartbeat: when the loop missed it by
+more than `threshold`, something is blocking the loop right now, so the stack
+of the loop thread points at the offending call (bcrypt, a sync client, a
+slow regex...). The stack is logged and kept for `/internal/stats/`.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any
+
+from src.config import settings
+from src.common import metrics
+from src.common.utils import TimingStats
+
+logger = logging.getLogger("root")
+
+
+class LoopMonitor:
+    def __init__(self, interval: float, threshold: float, max_reports: int) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = TimingStats()
+        self.blocked = 0
+        self.reports: deque[dict[str, Any]] = deque(maxlen=max_reports)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id = 0
+        self._last_beat = 0.0
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        """Must be called from the event loop to watch."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._task = self._loop.create_task(self._heartbeat())
+        self._stop.clear()
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        self._stop.set()
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self._last_beat = time.perf_counter()
+            lag = max(self._last_beat - start - self.interval, 0.0)
+            self.lag.record(lag)
+            metrics.event_loop_lag.observe(lag)
+
+    def _watch(self) -> None:
+        reported_beat = 0.0
+        while not self._stop.wait(self.threshold / 2):
+            last_beat = self._last_beat
+            blocked_for = time.perf_counter() - last_beat - self.interval
+            # One report per blocking call: the beat only moves once it returns.
+            if blocked_for > self.threshold and last_beat != reported_beat:
+                reported_beat = last_beat
+                self._report(blocked_for)
+
+    def _report(self, blocked_for: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        assert self._loop is not None
+        task = asyncio.current_task(self._loop)
+        report = {
+            "detected_at": datetime.now(timezone.utc).isoformat(),
+            "blocked_for_sec": round(blocked_for, 6),
+            "task": repr(task.get_coro()) if task is not None else None,
+            "stack": traceback.format_stack(frame),
+        }
+        self.blocked += 1
+        metrics.event_loop_blocked.inc()
+        self.reports.append(report)
+        logger.warning(
+            f"Event loop blocked for more than {blocked_for:.3f}s in "
+            f"{report['task']}:\n{''.join(report['stack'])}"
+        )
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "interval_sec": self.interval,
+            "threshold_sec": self.threshold,
+            "lag": self.lag.snapshot(),
+            "blocked": self.blocked,
+            "reports": list(self.reports),
+        }
+
+
+loop_monitor = LoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL_SEC,
+    threshold=settings.LOOP_MONITOR_THRESHOLD_SEC,
+    max_reports=settings.LOOP_MONITOR_MAX_REPORTS,
+)
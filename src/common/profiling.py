@@ -0,0 +1,115 @@
+"""
+Per-request profiling for debug environments.
+
+Requests sent with the `X-Profile` header or the `profile` query parameter
+are answered with a report instead of their response: the profile of the
+request, and the SQL statements and Redis commands it ran. `profile=speedscope`
+returns flame graph data for https://www.speedscope.app instead of text.
+
+The sampling profiler is pyinstrument (`profiling` extra); without it,
+cProfile is used, which also counts other requests served meanwhile.
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any
+
+_request_stats: ContextVar["RequestStats | None"] = ContextVar(
+    "request_stats", default=None
+)
+
+
+class RequestStats:
+    """SQL statements and Redis commands run while handling one request."""
+
+    def __init__(self) -> None:
+        self.queries: list[tuple[str, float]] = []
+        self.redis_round_trips = 0
+        self.redis_commands: Counter[str] = Counter()
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "sql": {
+                "count": len(self.queries),
+                "total_sec": round(sum(seconds for _, seconds in self.queries), 6),
+                "statements": [
+                    {"statement": statement, "duration_sec": round(seconds, 6)}
+                    for statement, seconds in self.queries
+                ],
+            },
+            "redis": {
+                "round_trips": self.redis_round_trips,
+                "commands": dict(self.redis_commands),
+            },
+        }
+
+
+def record_query(statement: str, seconds: float) -> None:
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries.append((statement, seconds))
+
+
+def record_redis_round_trip(*commands: str) -> None:
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.redis_round_trips += 1
+        stats.redis_commands.update(commands)
+
+
+class RequestProfiler:
+    def __init__(self, output: str) -> None:
+        self.output = output
+        self.stats = RequestStats()
+        self._profiler: Any = None
+        self._start = 0.0
+
+    def __enter__(self) -> "RequestProfiler":
+        try:
+            from pyinstrument import Profiler
+
+            self._profiler = Profiler(interval=0.001, async_mode="enabled")
+            self._profiler.start()
+        except ImportError:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._token = _request_stats.set(self.stats)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+        self.duration = time.perf_counter() - self._start
+        _request_stats.reset(self._token)
+
+    def _profile(self) -> tuple[str, Any]:
+        if isinstance(self._profiler, cProfile.Profile):
+            stream = io.StringIO()
+            pstats.Stats(self._profiler, stream=stream).sort_stats(
+                "cumulative"
+            ).print_stats(40)
+            return "cProfile", stream.getvalue()
+
+        if self.output == "speedscope":
+            from pyinstrument.renderers import SpeedscopeRenderer
+
+            speedscope = self._profiler.output(SpeedscopeRenderer())
+            return "pyinstrument", json.loads(speedscope)
+        return "pyinstrument", self._profiler.output_text(unicode=False, color=False)
+
+    def report(self) -> dict[str, Any]:
+        profiler, profile = self._profile()
+        return {
+            "duration_sec": round(self.duration, 6),
+            **self.stats.report(),
+            "profiler": profiler,
+            "profile": profile,
+        }
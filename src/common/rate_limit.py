@@ -0,0 +1,69 @@
+"""
+Token bucket rate limiting in Redis.
+
+A bucket holds up to `capacity` tokens and gets one back every `refill_sec`
+seconds. A request takes one token from every bucket it is checked against,
+or none when any of them is empty. The refill is computed from the Redis
+clock when the bucket is read, so nothing runs in between.
+"""
+
+import math
+from typing import NamedTuple
+
+from redis.asyncio import Redis
+
+from src.common.repositories import LuaScript
+
+
+class Bucket(NamedTuple):
+    key: str
+    capacity: int
+    refill_sec: float
+
+
+# KEYS: buckets
+# ARGV: capacity and refill interval in milliseconds, for each bucket in turn
+# Returns 0 when a token was taken from every bucket, otherwise the number
+# of milliseconds until all of them have one.
+_TAKE_TOKEN = LuaScript(
+    """
+local time = redis.call('TIME')
+local now = time[1] * 1000 + math.floor(time[2] / 1000)
+local tokens = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local refill = tonumber(ARGV[i * 2])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(bucket[1]) or capacity
+    local elapsed = math.max(now - (tonumber(bucket[2]) or now), 0)
+    available = math.min(capacity, available + elapsed / refill)
+    if available < 1 then
+        wait = math.max(wait, math.ceil((1 - available) * refill))
+    end
+    tokens[i] = available
+end
+if wait > 0 then
+    return wait
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local refill = tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 'tokens', tostring(tokens[i] - 1), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity * refill))
+end
+return 0
+"""
+)
+
+
+async def take_token(redis: Redis, *buckets: Bucket) -> int:
+    """
+    Takes a token from every bucket at once. Returns 0 on success, otherwise
+    the seconds to wait before retrying, rounded up.
+    """
+    args: list[int] = []
+    for bucket in buckets:
+        args += [bucket.capacity, math.ceil(bucket.refill_sec * 1000)]
+    wait_ms = await _TAKE_TOKEN(redis, [bucket.key for bucket in buckets], args)
+    return math.ceil(int(wait_ms) / 1000)
@@ -1,5 +1,42 @@
-from typing import Any
+import hashlib
+from typing import Any, Awaitable, cast
 from redis.asyncio import Redis
+from redis.exceptions import NoScriptError
+
+_scripts: list["LuaScript"] = []
+
+
+class LuaScript:
+    """
+    Lua script called by its SHA with EVALSHA.
+    `load_scripts` registers every script at startup; a Redis that lost its
+    script cache gets the source again on the first NOSCRIPT error.
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.sha = hashlib.sha1(source.encode()).hexdigest()
+        _scripts.append(self)
+
+    async def __call__(self, redis: Redis, keys: list[str], args: list[Any]) -> Any:
+        try:
+            return await self._evalsha(redis, keys, args)
+        except NoScriptError:
+            await redis.script_load(self.source)
+            return await self._evalsha(redis, keys, args)
+
+    def _evalsha(
+        self, redis: Redis, keys: list[str], args: list[Any]
+    ) -> Awaitable[Any]:
+        # The stubs are shared with the sync client, so the awaitable is lost.
+        return cast(Awaitable[Any], redis.evalsha(self.sha, len(keys), *keys, *args))
+
+
+async def load_scripts(redis: Redis) -> None:
+    async with redis.pipeline(transaction=False) as pipe:
+        for script in _scripts:
+            pipe.script_load(script.source)
+        await pipe.execute()
 
 
 async def set_key_to_cache(redis: Redis, name: str, value: str, ex: int) -> None:
@@ -15,9 +52,3 @@ async def get_value_from_cache(redis: Redis, key: str) -> str | None:
     if value is None:
         return None
     return value
-
-
-async def del_cache_key_by_regex_pattern(redis: Redis, pattern: str) -> None:
-    keys = await redis.keys(pattern=pattern)
-    if keys:
-        await redis.delete(*keys)
@@ -0,0 +1,44 @@
+from typing import Annotated, Any
+
+from redis.asyncio import Redis
+from fastapi import APIRouter, Depends, status
+
+from src.database import db_pool_stats, redis_pool_stats, redis_conn
+from src.common.cache import cache_stats
+from src.common.log import logging_stats
+from src.common.monitor import loop_monitor
+from src.auth.v1.dependencies import check_internal_api_key, identity_filter
+from src.auth.v1.utils import password_hasher
+
+router = APIRouter()
+
+
+@router.get(
+    "/stats/",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(check_internal_api_key)],
+)
+async def get_stats(redis: Annotated[Redis, Depends(redis_conn)]) -> dict[str, Any]:
+    return {
+        "password_hasher": password_hasher.stats(),
+        "redis_pool": redis_pool_stats(),
+        "db_pool": db_pool_stats(),
+        "caches": cache_stats(),
+        "logging": logging_stats(),
+        "event_loop": loop_monitor.stats(),
+        "identity_filter": await identity_filter.stats(redis),
+    }
+
+
+@router.put(
+    "/loop-monitor/",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(check_internal_api_key)],
+)
+async def toggle_loop_monitor(enabled: bool) -> dict[str, Any]:
+    """Turns the event loop monitor on or off until the next restart."""
+    if enabled:
+        loop_monitor.start()
+    else:
+        await loop_monitor.stop()
+    return loop_monitor.stats()
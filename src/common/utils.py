@@ -0,0 +1,21 @@
+class TimingStats:
+    """Running count, total and max of durations measured in seconds."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "total_sec": round(self.total, 6),
+            "avg_sec": round(self.total / self.count, 6) if self.count else 0.0,
+            "max_sec": round(self.max, 6),
+        }
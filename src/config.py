@@ -17,8 +17,38 @@ class CustomBaseSettings(BaseSettings):
 
 class Config(CustomBaseSettings):
     POSTGRES_URL: PostgresDsn
+    POSTGRES_POOL_SIZE: int = 10
+    POSTGRES_MAX_OVERFLOW: int = 10
+    POSTGRES_POOL_TIMEOUT_SEC: float = 10
+    POSTGRES_POOL_RECYCLE_SEC: int = 1800
+    POSTGRES_POOL_PRE_PING: bool = True
     REDIS_URL: RedisDsn
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT_SEC: float = 5
+    REDIS_HEALTH_CHECK_INTERVAL_SEC: int = 30
+    REDIS_SOCKET_TIMEOUT_SEC: float = 5
+    REDIS_SOCKET_CONNECT_TIMEOUT_SEC: float = 5
     ENVIRONMENT: Environment = Environment.PRODUCTION
+    # Comma separated addresses or networks of the reverse proxies in front of
+    # the app. X-Forwarded-For is only trusted from them; without it every
+    # client behind a proxy shares the proxy's address (and its login limit).
+    TRUSTED_PROXIES: str | None = None
+    LOG_LEVEL: str | None = None  # Defaults to the environment's level.
+    LOG_QUEUE_MAX_SIZE: int = 10000
+    LOOP_MONITOR_ENABLED: bool | None = None  # Defaults to the environment's.
+    LOOP_MONITOR_INTERVAL_SEC: float = 0.1
+    LOOP_MONITOR_THRESHOLD_SEC: float = 0.1
+    LOOP_MONITOR_MAX_REPORTS: int = 20
+
+    @property
+    def log_level(self) -> str:
+        return self.LOG_LEVEL or self.ENVIRONMENT.log_level
+
+    @property
+    def loop_monitor_enabled(self) -> bool:
+        if self.LOOP_MONITOR_ENABLED is not None:
+            return self.LOOP_MONITOR_ENABLED
+        return self.ENVIRONMENT.loop_monitor_enabled
 
 
 settings = Config()  # type: ignore
@@ -75,6 +105,11 @@ class LogConfig(BaseModel):
             "level": "DEBUG",
             "propagate": False,
         },
+        "notifications": {
+            "handlers": ["console", "file"],
+            "level": "DEBUG",
+            "propagate": False,
+        },
     }
 
 
@@ -18,6 +18,15 @@ class Environment(str, Enum):
     def is_debug(self):
         return self in (self.LOCAL, self.STAGING)
 
+    @property
+    def log_level(self) -> str:
+        return "DEBUG" if self == self.LOCAL else "INFO"
+
+    @property
+    def loop_monitor_enabled(self) -> bool:
+        # Off in production until the sampling overhead has been measured there.
+        return self.is_debug
+
     @property
     def is_deploy(self):
         return self in (self.PRODUCTION)
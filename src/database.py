@@ -1,9 +1,11 @@
-from typing import AsyncGenerator
+import time
+from typing import Any
 from datetime import datetime
 
 import redis.asyncio as redis
 from sqlalchemy import MetaData, types as sql_types
 from sqlalchemy.orm import DeclarativeBase, MappedAsDataclass
+from sqlalchemy.pool import AsyncAdaptedQueuePool, PoolProxiedConnection
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -15,8 +17,38 @@ from src.config import settings
 from src.constants import DB_NAMING_CONVENTION
 from src.auth.v1 import types as auth_types
 from src.providers.v1 import types as sellers_types
+from src.notifications.v1 import types as notifications_types
+from src.common.utils import TimingStats
+from src.common import metrics
 
-async_engine: AsyncEngine = create_async_engine(str(settings.POSTGRES_URL))
+db_pool_checkout_wait = TimingStats()
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """Records how long every checkout waited for a connection."""
+
+    def connect(self) -> PoolProxiedConnection:
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            wait = time.perf_counter() - start
+            db_pool_checkout_wait.record(wait)
+            metrics.db_pool_checkout_wait.observe(wait)
+
+
+async_engine: AsyncEngine = create_async_engine(
+    str(settings.POSTGRES_URL),
+    poolclass=TimedAsyncAdaptedQueuePool,
+    pool_size=settings.POSTGRES_POOL_SIZE,
+    max_overflow=settings.POSTGRES_MAX_OVERFLOW,
+    pool_timeout=settings.POSTGRES_POOL_TIMEOUT_SEC,
+    pool_recycle=settings.POSTGRES_POOL_RECYCLE_SEC,
+    pool_pre_ping=settings.POSTGRES_POOL_PRE_PING,
+)
+metrics.instrument_engine(async_engine.sync_engine)
+
+async_session_maker = async_sessionmaker(async_engine, expire_on_commit=False)
 
 
 class Base(DeclarativeBase, MappedAsDataclass):
@@ -29,16 +61,69 @@ class Base(DeclarativeBase, MappedAsDataclass):
         auth_types.PermissionId: sql_types.INTEGER,
         sellers_types.ProviderId: sql_types.UUID,
         sellers_types.ProviderStaffId: sql_types.INTEGER,
+        notifications_types.NotificationId: sql_types.INTEGER,
     }
 
 
 async def session_maker() -> async_sessionmaker[AsyncSession]:
-    return async_sessionmaker(async_engine, expire_on_commit=False)
+    return async_session_maker
+
+
+def db_pool_stats() -> dict[str, Any]:
+    pool = async_engine.pool
+    assert isinstance(pool, TimedAsyncAdaptedQueuePool)
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "checkout_wait": db_pool_checkout_wait.snapshot(),
+    }
+
+
+redis_pool: redis.BlockingConnectionPool | None = None
+redis_client: redis.Redis | None = None
+
+
+def init_redis_pool() -> redis.Redis:
+    """
+    Creates the application wide connection pool and the client sharing it.
+    Called from the lifespan, and lazily by `redis_conn` when no lifespan ran.
+    """
+    global redis_pool, redis_client
+    if redis_client is None:
+        redis_pool = redis.BlockingConnectionPool.from_url(
+            url=str(settings.REDIS_URL),
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT_SEC,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL_SEC,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SEC,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT_SEC,
+        )
+        redis_client = metrics.InstrumentedRedis(connection_pool=redis_pool)
+    return redis_client
+
+
+async def close_redis_pool() -> None:
+    global redis_pool, redis_client
+    if redis_pool is not None:
+        await redis_pool.aclose()
+    redis_pool = None
+    redis_client = None
+
+
+def redis_pool_stats() -> dict[str, Any]:
+    if redis_pool is None:
+        return {}
+    in_use = len(redis_pool._in_use_connections)
+    available = len(redis_pool._available_connections)
+    return {
+        "max_connections": redis_pool.max_connections,
+        "created": in_use + available,
+        "in_use": in_use,
+        "available": available,
+    }
 
 
-async def redis_conn() -> AsyncGenerator[redis.Redis, None]:
-    client = redis.Redis.from_url(url=str(settings.REDIS_URL))
-    try:
-        yield client
-    finally:
-        await client.aclose()
+async def redis_conn() -> redis.Redis:
+    return init_redis_pool()
@@ -1,12 +1,22 @@
 import logging
-from logging.config import dictConfig
 from typing import AsyncGenerator
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
-from src.config import LogConfig, app_configs
+from src.config import app_configs, settings
+from src.common.log import configure_logging, stop_logging
+from src.database import async_engine, init_redis_pool, close_redis_pool
+from src.common.cache import start_invalidation_listener, stop_invalidation_listener
+from src.common.repositories import load_scripts
+from src.common.metrics import mark_process_dead, metrics
+from src.common.middlewares import ProfilingMiddleware, RequestMetricsMiddleware
+from src.common.monitor import loop_monitor
+from src.common import router as common_router
 from src.auth.v1 import router as auth_router_v1
+from src.auth.v1.keys import load_key_set
+from src.auth.v1.utils import password_hasher
 from src.providers.v1 import router as providers_router_v1
 from src.admin.v1 import router as admin_router_v1
 
@@ -15,16 +25,45 @@ logger = logging.getLogger("root")
 
 @asynccontextmanager
 async def lifespan(_application: FastAPI) -> AsyncGenerator:
-    dictConfig(LogConfig().model_dump())
+    configure_logging()
+    if settings.loop_monitor_enabled:
+        loop_monitor.start()
+    load_key_set()
+    password_hasher.start()
+    redis = init_redis_pool()
+    try:
+        await load_scripts(redis)
+    except Exception as ex:  # Scripts are loaded again on the first NOSCRIPT error.
+        logger.warning(ex)
+    start_invalidation_listener(redis)
     logger.info("App is running...")
     yield
+    await loop_monitor.stop()
+    await stop_invalidation_listener()
+    await close_redis_pool()
+    await async_engine.dispose()
+    password_hasher.shutdown()
+    mark_process_dead()
+    stop_logging()
 
 
 app = FastAPI(**app_configs, lifespan=lifespan)
-
+app.add_middleware(RequestMetricsMiddleware)
+if settings.ENVIRONMENT.is_debug:
+    app.add_middleware(ProfilingMiddleware)
+if settings.TRUSTED_PROXIES:
+    # Added last, so it runs first and everything sees the client's address.
+    # Uvicorn types its ASGI apps apart from Starlette's, hence the ignore.
+    app.add_middleware(
+        ProxyHeadersMiddleware,  # pyright: ignore[reportArgumentType]
+        trusted_hosts=settings.TRUSTED_PROXIES,
+    )
+# An API route, so its requests carry the route in their scope and are labeled.
+app.add_api_route("/metrics", metrics, include_in_schema=False)
 
 app.include_router(router=auth_router_v1.router, prefix="/v1/auth", tags=["auth"])
 app.include_router(router=admin_router_v1.router, prefix="/v1/admin", tags=["admin"])
+app.include_router(router=common_router.router, prefix="/internal", tags=["internal"])
 # app.include_router(
 #     router=sellers_router_v1.router, prefix="/v1/providers", tags=["providers"]
 # )
@@ -0,0 +1,22 @@
+from typing import Literal
+
+from pydantic_settings import BaseSettings
+
+
+class NotificationsConfig(BaseSettings):
+    NOTIFICATIONS_TRANSPORT: Literal["stdout", "file"] = "stdout"
+    NOTIFICATIONS_FILE_PATH: str = "/app/logs/notifications.jsonl"
+    NOTIFICATIONS_BATCH_SIZE: int = 50
+    NOTIFICATIONS_CONCURRENCY: int = 10
+    NOTIFICATIONS_POLL_INTERVAL_SEC: float = 1
+    # Claimed rows are retried after this if the worker dies while sending them.
+    NOTIFICATIONS_CLAIM_LEASE_SEC: int = 60
+    NOTIFICATIONS_MAX_ATTEMPTS: int = 5
+    NOTIFICATIONS_RETRY_BACKOFF_BASE_SEC: float = 2
+    NOTIFICATIONS_RETRY_BACKOFF_MAX_SEC: float = 300
+    # Sent and failed rows are deleted once this old; the worker checks hourly.
+    NOTIFICATIONS_RETENTION_SEC: int = 7 * 24 * 3600
+    NOTIFICATIONS_PURGE_INTERVAL_SEC: float = 3600
+
+
+notifications_config = NotificationsConfig()
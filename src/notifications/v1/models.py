@@ -0,0 +1,36 @@
+from datetime import datetime
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+
+from src.database import Base
+from src.notifications.v1 import types
+
+
+class NotificationOutbox(Base):
+    # Written in the transaction producing the notification, sent by the worker.
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        sa.PrimaryKeyConstraint("id"),
+        sa.Index(
+            "ix_notification_outbox_pending",
+            "available_at",
+            postgresql_where=sa.text("status = 'PENDING'"),
+        ),
+    )
+    id: so.Mapped[types.NotificationId] = so.mapped_column(autoincrement=True)
+    channel: so.Mapped[types.NotificationChannel] = so.mapped_column(
+        sa.Enum(types.NotificationChannel)
+    )
+    recipient: so.Mapped[str] = so.mapped_column(sa.String(200))
+    # Carries activation tokens and passwords: cleared once the row is settled.
+    body: so.Mapped[str | None] = so.mapped_column(sa.Text)
+    created_at: so.Mapped[datetime] = so.mapped_column(server_default=sa.func.now())
+    # Next time the worker may claim the row: retry backoff or the claim lease.
+    available_at: so.Mapped[datetime] = so.mapped_column(server_default=sa.func.now())
+    status: so.Mapped[types.NotificationStatus] = so.mapped_column(
+        sa.Enum(types.NotificationStatus), default=types.NotificationStatus.PENDING
+    )
+    attempts: so.Mapped[int] = so.mapped_column(default=0)
+    sent_at: so.Mapped[datetime | None] = so.mapped_column(default=None)
+    last_error: so.Mapped[str | None] = so.mapped_column(sa.Text, default=None)
@@ -0,0 +1,121 @@
+import logging
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.notifications.v1 import models
+from src.notifications.v1 import types
+
+logger = logging.getLogger("notifications")
+
+
+async def enqueue_notification(
+    db_session: AsyncSession,
+    channel: types.NotificationChannel,
+    recipient: str,
+    body: str,
+) -> None:
+    smtm = sa.insert(models.NotificationOutbox).values(
+        {
+            models.NotificationOutbox.channel: channel,
+            models.NotificationOutbox.recipient: recipient,
+            models.NotificationOutbox.body: body,
+        }
+    )
+    await db_session.execute(smtm)
+
+
+async def claim_notifications(
+    db_session: AsyncSession, batch_size: int, lease_sec: int
+) -> list[models.NotificationOutbox]:
+    # UPDATE notification_outbox
+    # SET available_at=now() + interval '60 seconds', attempts=attempts + 1
+    # WHERE id IN (
+    #     SELECT id FROM notification_outbox
+    #     WHERE status='PENDING' AND available_at <= now()
+    #     ORDER BY available_at LIMIT 50
+    #     FOR UPDATE SKIP LOCKED
+    # )
+    # RETURNING *
+    claimable = (
+        sa.select(models.NotificationOutbox.id)
+        .where(
+            sa.and_(
+                models.NotificationOutbox.status == types.NotificationStatus.PENDING,
+                models.NotificationOutbox.available_at <= sa.func.now(),
+            )
+        )
+        .order_by(models.NotificationOutbox.available_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    outbox = models.NotificationOutbox
+    smtm = (
+        sa.update(outbox)
+        .where(outbox.id.in_(claimable.scalar_subquery()))
+        .values(
+            {
+                outbox.available_at: sa.func.now() + timedelta(seconds=lease_sec),
+                outbox.attempts: outbox.attempts + 1,
+            }
+        )
+        .returning(outbox)
+    )
+    return list((await db_session.scalars(smtm)).all())
+
+
+async def mark_notifications_sent(
+    db_session: AsyncSession, notification_ids: list[types.NotificationId]
+) -> None:
+    smtm = (
+        sa.update(models.NotificationOutbox)
+        .where(models.NotificationOutbox.id.in_(notification_ids))
+        .values(
+            {
+                models.NotificationOutbox.status: types.NotificationStatus.SENT,
+                models.NotificationOutbox.sent_at: sa.func.now(),
+                models.NotificationOutbox.last_error: None,
+                models.NotificationOutbox.body: None,
+            }
+        )
+    )
+    await db_session.execute(smtm)
+
+
+async def mark_notification_failed(
+    db_session: AsyncSession,
+    notification_id: types.NotificationId,
+    error: str,
+    retry_at: datetime | None,
+) -> None:
+    """Schedules another attempt at `retry_at`, or gives up when it is None."""
+    values: dict = {models.NotificationOutbox.last_error: error}
+    if retry_at is None:
+        values[models.NotificationOutbox.status] = types.NotificationStatus.FAILED
+        values[models.NotificationOutbox.body] = None
+    else:
+        values[models.NotificationOutbox.available_at] = retry_at
+    smtm = (
+        sa.update(models.NotificationOutbox)
+        .where(models.NotificationOutbox.id == notification_id)
+        .values(values)
+    )
+    await db_session.execute(smtm)
+
+
+async def purge_notifications(db_session: AsyncSession, retention_sec: int) -> int:
+    """Deletes settled rows created more than `retention_sec` seconds ago."""
+    # DELETE FROM notification_outbox
+    # WHERE status IN ('SENT', 'FAILED')
+    #   AND created_at < now() - interval '604800 seconds'
+    smtm = sa.delete(models.NotificationOutbox).where(
+        sa.and_(
+            models.NotificationOutbox.status.in_(
+                [types.NotificationStatus.SENT, types.NotificationStatus.FAILED]
+            ),
+            models.NotificationOutbox.created_at
+            < sa.func.now() - timedelta(seconds=retention_sec),
+        )
+    )
+    return (await db_session.execute(smtm)).rowcount
@@ -0,0 +1,63 @@
+"""
+Transports deliver claimed notifications.
+
+Real providers plug in by implementing `Transport` and being returned by
+`get_transport`. The stdout and file transports are local stand-ins.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Protocol
+
+from src.notifications.v1.config import notifications_config
+from src.notifications.v1.types import NotificationChannel
+
+logger = logging.getLogger("notifications")
+
+
+class Transport(Protocol):
+    async def send(
+        self, channel: NotificationChannel, recipient: str, body: str
+    ) -> None:
+        """Raises on failure, so the notification is retried."""
+        ...
+
+
+class StdoutTransport:
+    async def send(
+        self, channel: NotificationChannel, recipient: str, body: str
+    ) -> None:
+        print(f"[{channel}] to {recipient}: {body}", flush=True)
+
+
+class FileTransport:
+    """
+    Appends one JSON line per notification to `path`. Bodies carry activation
+    tokens and passwords, so only their length is written.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = asyncio.Lock()
+
+    def _append(self, line: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+
+    async def send(
+        self, channel: NotificationChannel, recipient: str, body: str
+    ) -> None:
+        line = json.dumps(
+            {"channel": channel, "recipient": recipient, "body_length": len(body)}
+        )
+        async with self._lock:
+            await asyncio.to_thread(self._append, line)
+
+
+def get_transport() -> Transport:
+    match notifications_config.NOTIFICATIONS_TRANSPORT:
+        case "stdout":
+            return StdoutTransport()
+        case "file":
+            return FileTransport(notifications_config.NOTIFICATIONS_FILE_PATH)
@@ -0,0 +1,15 @@
+from typing import NewType
+from enum import StrEnum, auto
+
+NotificationId = NewType("NotificationId", int)
+
+
+class NotificationChannel(StrEnum):
+    EMAIL = auto()
+    SMS = auto()
+
+
+class NotificationStatus(StrEnum):
+    PENDING = auto()
+    SENT = auto()
+    FAILED = auto()
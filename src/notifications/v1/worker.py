@@ -0,0 +1,146 @@
+"""
+Delivers notifications written to the outbox.
+
+Usage:
+    python -m src.notifications.v1.worker
+
+Any number of workers can run side by side: rows are claimed with
+FOR UPDATE SKIP LOCKED and leased for NOTIFICATIONS_CLAIM_LEASE_SEC, so a
+worker dying mid batch only delays its rows. Delivery is at least once.
+
+Bodies are cleared once a row is sent or given up, and settled rows are
+deleted after NOTIFICATIONS_RETENTION_SEC.
+"""
+
+import asyncio
+import logging
+import signal
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.common.log import configure_logging, stop_logging
+from src.database import async_engine, async_session_maker
+from src.notifications.v1 import models
+from src.notifications.v1 import repositories
+from src.notifications.v1.config import notifications_config
+from src.notifications.v1.transports import Transport, get_transport
+
+logger = logging.getLogger("notifications")
+
+
+def retry_at(attempts: int) -> datetime | None:
+    """Exponential backoff after `attempts` failed attempts, None to give up."""
+    if attempts >= notifications_config.NOTIFICATIONS_MAX_ATTEMPTS:
+        return None
+    delay = min(
+        notifications_config.NOTIFICATIONS_RETRY_BACKOFF_BASE_SEC**attempts,
+        notifications_config.NOTIFICATIONS_RETRY_BACKOFF_MAX_SEC,
+    )
+    return datetime.now(timezone.utc) + timedelta(seconds=delay)
+
+
+async def _send(
+    transport: Transport,
+    semaphore: asyncio.Semaphore,
+    notification: models.NotificationOutbox,
+) -> Exception | None:
+    async with semaphore:
+        try:
+            assert notification.body is not None  # Only settled rows are cleared.
+            await transport.send(
+                notification.channel, notification.recipient, notification.body
+            )
+            return None
+        except Exception as ex:
+            return ex
+
+
+async def dispatch_batch(
+    session_maker: async_sessionmaker[AsyncSession], transport: Transport
+) -> int:
+    """Claims, sends and settles one batch. Returns how many rows were claimed."""
+    async with session_maker.begin() as session:
+        notifications = await repositories.claim_notifications(
+            session,
+            notifications_config.NOTIFICATIONS_BATCH_SIZE,
+            notifications_config.NOTIFICATIONS_CLAIM_LEASE_SEC,
+        )
+    if not notifications:
+        return 0
+
+    # Sent outside of any transaction, so slow providers hold no connection.
+    semaphore = asyncio.Semaphore(notifications_config.NOTIFICATIONS_CONCURRENCY)
+    errors = await asyncio.gather(
+        *(_send(transport, semaphore, notification) for notification in notifications)
+    )
+
+    async with session_maker.begin() as session:
+        sent = [n.id for n, error in zip(notifications, errors) if error is None]
+        if sent:
+            await repositories.mark_notifications_sent(session, sent)
+        for notification, error in zip(notifications, errors):
+            if error is None:
+                continue
+            next_attempt = retry_at(notification.attempts)
+            if next_attempt is None:
+                logger.error(f"Giving up notification {notification.id}: {error!r}")
+            else:
+                logger.warning(f"Notification {notification.id} failed: {error!r}")
+            await repositories.mark_notification_failed(
+                session, notification.id, repr(error), next_attempt
+            )
+    return len(notifications)
+
+
+async def purge(session_maker: async_sessionmaker[AsyncSession]) -> int:
+    async with session_maker.begin() as session:
+        purged = await repositories.purge_notifications(
+            session, notifications_config.NOTIFICATIONS_RETENTION_SEC
+        )
+    if purged:
+        logger.info(f"Purged {purged} settled notifications.")
+    return purged
+
+
+async def run(stop: asyncio.Event) -> None:
+    transport = get_transport()
+    next_purge = time.monotonic()
+    while not stop.is_set():
+        if time.monotonic() >= next_purge:
+            next_purge += notifications_config.NOTIFICATIONS_PURGE_INTERVAL_SEC
+            try:
+                await purge(async_session_maker)
+            except Exception as ex:
+                logger.exception(ex)
+        try:
+            claimed = await dispatch_batch(async_session_maker, transport)
+        except Exception as ex:
+            logger.exception(ex)
+            claimed = 0
+        if claimed < notifications_config.NOTIFICATIONS_BATCH_SIZE:
+            try:
+                await asyncio.wait_for(
+                    stop.wait(), notifications_config.NOTIFICATIONS_POLL_INTERVAL_SEC
+                )
+            except asyncio.TimeoutError:
+                pass
+
+
+async def main() -> None:
+    configure_logging()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    logger.info("Notification worker is running...")
+    try:
+        await run(stop)
+    finally:
+        await async_engine.dispose()
+        stop_logging()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
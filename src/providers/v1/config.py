@@ -0,0 +1,12 @@
+from pydantic_settings import BaseSettings
+
+
+class ProvidersConfig(BaseSettings):
+    STAFF_PERMISSIONS_CACHE_MAX_ENTRIES: int = 10000
+    STAFF_PERMISSIONS_CACHE_TTL_SEC: float = 10
+    # Fallback bound on staleness if an invalidation is missed.
+    STAFF_PERMISSIONS_REDIS_TTL_SEC: int = 300
+    PERMISSION_ID_CACHE_TTL_SEC: float = 300
+
+
+providers_config = ProvidersConfig()
@@ -0,0 +1,177 @@
+import json
+import logging
+from typing import Annotated, Awaitable, Callable, Literal, TypedDict
+from uuid import UUID
+
+from redis.asyncio import Redis
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.database import session_maker, redis_conn
+from src.auth.v1.dependencies import TokenPayload, check_security_stamp
+from src.auth.v1.types import UserId, PermissionId
+from src.auth.v1.utils import decode_permission_mask
+from src.common.cache import TTLCache, publish_invalidation
+from src.common.repositories import get_value_from_cache, set_key_to_cache
+from src.providers.v1 import exceptions
+from src.providers.v1 import repositories
+from src.providers.v1.config import providers_config
+from src.providers.v1.types import ProviderId
+
+logger = logging.getLogger("providers")
+
+staff_permissions_cache = TTLCache(
+    name="staff-permissions",
+    maxsize=providers_config.STAFF_PERMISSIONS_CACHE_MAX_ENTRIES,
+    ttl=providers_config.STAFF_PERMISSIONS_CACHE_TTL_SEC,
+)
+
+# A name only gets a new id if its permission is recreated, so the TTL is enough.
+permission_id_cache = TTLCache(
+    name="permission-id",
+    maxsize=1000,
+    ttl=providers_config.PERMISSION_ID_CACHE_TTL_SEC,
+)
+
+
+class StaffPermissions(TypedDict):
+    provider_id: ProviderId
+    is_founder: bool
+    mask: int  # Bit `n` is set when the staff has the permission with id `n`.
+
+
+def permission_mask(permission_ids: list[PermissionId]) -> int:
+    mask = 0
+    for permission_id in permission_ids:
+        mask |= 1 << permission_id
+    return mask
+
+
+def has_permission(permissions: StaffPermissions, permission_id: PermissionId) -> bool:
+    # Founders own their provider, so they hold every permission.
+    return permissions["is_founder"] or bool(permissions["mask"] >> permission_id & 1)
+
+
+def permissions_from_claims(token_data: TokenPayload) -> StaffPermissions:
+    """Permissions embedded by `utils.encode_token`, so no lookup is needed."""
+    provider_id = token_data.get("pid")
+    assert provider_id is not None
+    return {
+        "provider_id": ProviderId(UUID(provider_id)),
+        "is_founder": token_data.get("fnd", False),
+        "mask": decode_permission_mask(token_data.get("perms", "")),
+    }
+
+
+def _staff_permissions_key(user_id: UserId) -> str:
+    return f"staff-permissions:{user_id}"
+
+
+async def get_staff_permissions(
+    session_maker: async_sessionmaker[AsyncSession], redis: Redis, user_id: UserId
+) -> StaffPermissions | None:
+    """
+    Looks the permission bitmap up in the local cache, then in Redis, then
+    resolves it from the staff roles in Postgres. Users who aren't staff are
+    cached too (as `null`), so customers don't reach Postgres every time.
+    `invalidate_staff_permissions` must be called whenever staff roles, the
+    permissions of their roles or the staff itself change.
+    """
+    key = _staff_permissions_key(user_id)
+    entry: StaffPermissions | Literal[False] | None = staff_permissions_cache.get(key)
+    if entry is not None:
+        return entry or None
+    cached = await get_value_from_cache(redis, key)
+    if cached is not None:
+        data = json.loads(cached)
+        permissions: StaffPermissions | None = None
+        if data is not None:
+            permissions = {
+                "provider_id": ProviderId(UUID(data["provider_id"])),
+                "is_founder": data["is_founder"],
+                "mask": int(data["mask"], 16),
+            }
+    else:
+        async with session_maker.begin() as session:
+            row = await repositories.get_staff_permission_ids(session, user_id)
+        permissions = None
+        if row is not None:
+            provider_id, is_founder, permission_ids = row
+            permissions = {
+                "provider_id": provider_id,
+                "is_founder": is_founder,
+                "mask": permission_mask(permission_ids),
+            }
+        await set_key_to_cache(
+            redis,
+            key,
+            json.dumps(
+                permissions
+                and {
+                    **permissions,
+                    "provider_id": str(permissions["provider_id"]),
+                    "mask": format(permissions["mask"], "x"),
+                }
+            ),
+            ex=providers_config.STAFF_PERMISSIONS_REDIS_TTL_SEC,
+        )
+    staff_permissions_cache.set(key, permissions or False)
+    return permissions
+
+
+async def invalidate_staff_permissions(redis: Redis, *user_ids: UserId) -> None:
+    """Call it once the change is committed, or the old bitmap may be cached again."""
+    if not user_ids:
+        return
+    keys = [_staff_permissions_key(user_id) for user_id in user_ids]
+    await redis.delete(*keys)
+    await publish_invalidation(redis, staff_permissions_cache.name, *keys)
+
+
+async def _get_permission_id(
+    session_maker: async_sessionmaker[AsyncSession], name: str
+) -> PermissionId | None:
+    permission_id: PermissionId | None = permission_id_cache.get(name)
+    if permission_id is None:
+        async with session_maker.begin() as session:
+            permission_id = await repositories.get_permission_id_by_name(session, name)
+        if permission_id is not None:
+            permission_id_cache.set(name, permission_id)
+    return permission_id
+
+
+def requires(
+    permission: str,
+) -> Callable[..., Awaitable[StaffPermissions]]:
+    """
+    Dependency factory checking that the current user is an active provider
+    staff holding `permission`, e.g. `Depends(requires("manage-products"))`.
+    Tokens carrying permission claims are authorized from the claims alone.
+    """
+
+    async def _requires(
+        token_data: Annotated[TokenPayload, Depends(check_security_stamp)],
+        session_maker: Annotated[
+            async_sessionmaker[AsyncSession], Depends(session_maker)
+        ],
+        redis: Annotated[Redis, Depends(redis_conn)],
+    ) -> StaffPermissions:
+        if "pid" in token_data:
+            permissions = permissions_from_claims(token_data)
+        else:
+            permissions = await get_staff_permissions(
+                session_maker, redis, token_data["user_id"]
+            )
+        if permissions is None:
+            raise exceptions.NotProviderStaffExc
+        if permissions["is_founder"]:
+            return permissions
+        permission_id = await _get_permission_id(session_maker, permission)
+        if permission_id is None:
+            logger.warning(f"Unknown permission {permission!r} is required.")
+            raise exceptions.PermissionDeniedExc
+        if not has_permission(permissions, permission_id):
+            raise exceptions.PermissionDeniedExc
+        return permissions
+
+    return _requires
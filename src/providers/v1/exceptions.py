@@ -29,3 +29,15 @@ class StaffAlreadyAtWorkExc(HTTPException):
     def __init__(self) -> None:
         self.status_code = status.HTTP_400_BAD_REQUEST
         self.detail = "This user is already working for another provider."
+
+
+class NotProviderStaffExc(HTTPException):
+    def __init__(self) -> None:
+        self.status_code = status.HTTP_403_FORBIDDEN
+        self.detail = "Only provider staff can access this resource."
+
+
+class PermissionDeniedExc(HTTPException):
+    def __init__(self) -> None:
+        self.status_code = status.HTTP_403_FORBIDDEN
+        self.detail = "You don't have permission to perform this action."
@@ -1,12 +1,13 @@
 import logging
 
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.providers.v1 import models
 from src.providers.v1 import types
-from src.auth.v1.types import UserId, UserRole
-from src.auth.v1.models import User
+from src.auth.v1.types import UserId, UserRole, RoleId, PermissionId
+from src.auth.v1.models import User, RolePermission, Permission
 
 logger = logging.getLogger("sellers")
 
@@ -38,6 +39,107 @@ async def create_provider(
     return await db_session.scalar(smtm)
 
 
+async def get_staff_permission_ids(
+    db_session: AsyncSession, user_id: UserId
+) -> tuple[types.ProviderId, bool, list[PermissionId]] | None:
+    # SELECT ps.provider_id, ps.is_founder,
+    #        array_remove(array_agg(DISTINCT rp.permission_id), NULL)
+    # FROM provider_staff ps
+    # LEFT JOIN provider_staff_roles psr ON ps.id=psr.provider_staff_id
+    # LEFT JOIN role_permissions rp ON psr.role_id=rp.role_id
+    # WHERE ps.user_id='06a0b637-7475-4ed8-86de-d252162cf650'::UUID
+    #   AND ps.is_active=true
+    # GROUP BY ps.id
+    smtm = (
+        sa.select(
+            models.ProviderStaff.provider_id,
+            models.ProviderStaff.is_founder,
+            sa.func.array_remove(
+                sa.func.array_agg(sa.distinct(RolePermission.permission_id)), None
+            ),
+        )
+        .select_from(models.ProviderStaff)
+        .join(
+            models.ProviderStaffRole,
+            models.ProviderStaff.id == models.ProviderStaffRole.provider_staff_id,
+            isouter=True,
+        )
+        .join(
+            RolePermission,
+            models.ProviderStaffRole.role_id == RolePermission.role_id,
+            isouter=True,
+        )
+        .where(
+            sa.and_(
+                models.ProviderStaff.user_id == user_id,
+                models.ProviderStaff.is_active.is_(True),
+            )
+        )
+        .group_by(models.ProviderStaff.id)
+    )
+    return (await db_session.execute(smtm)).tuples().first()
+
+
+async def create_staff_role(
+    db_session: AsyncSession, user_id: UserId, role_id: RoleId
+) -> None:
+    # INSERT INTO provider_staff_roles (provider_staff_id, role_id)
+    # SELECT ps.id, 3 FROM provider_staff ps
+    # WHERE ps.user_id='06a0b637-7475-4ed8-86de-d252162cf650'::UUID
+    # ON CONFLICT DO NOTHING
+    smtm = (
+        postgresql.insert(models.ProviderStaffRole)
+        .from_select(
+            [
+                models.ProviderStaffRole.provider_staff_id,
+                models.ProviderStaffRole.role_id,
+            ],
+            sa.select(models.ProviderStaff.id, sa.literal(role_id)).where(
+                models.ProviderStaff.user_id == user_id
+            ),
+        )
+        .on_conflict_do_nothing()
+    )
+    await db_session.execute(smtm)
+
+
+async def create_role_permission(
+    db_session: AsyncSession, role_id: RoleId, permission_id: PermissionId
+) -> None:
+    smtm = (
+        postgresql.insert(RolePermission)
+        .values(
+            {
+                RolePermission.role_id: role_id,
+                RolePermission.permission_id: permission_id,
+            }
+        )
+        .on_conflict_do_nothing()
+    )
+    await db_session.execute(smtm)
+
+
+async def get_user_ids_by_role(
+    db_session: AsyncSession, role_id: RoleId
+) -> list[UserId]:
+    smtm = (
+        sa.select(models.ProviderStaff.user_id)
+        .join(
+            models.ProviderStaffRole,
+            models.ProviderStaff.id == models.ProviderStaffRole.provider_staff_id,
+        )
+        .where(models.ProviderStaffRole.role_id == role_id)
+    )
+    return list((await db_session.scalars(smtm)).all())
+
+
+async def get_permission_id_by_name(
+    db_session: AsyncSession, name: str
+) -> PermissionId | None:
+    smtm = sa.select(Permission.id).where(Permission.name == name)
+    return await db_session.scalar(smtm)
+
+
 async def check_staff_status_before_invitation(
     db_session: AsyncSession, user_id: UserId
 ) -> tuple[bool, UserRole, types.InvitationStatus] | None:
@@ -1,17 +1,51 @@
 import logging
 
+from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from src.providers.v1 import exceptions
 from src.providers.v1 import repositories
 from src.providers.v1 import types
+from src.providers.v1.dependencies import invalidate_staff_permissions
 from src.common.exceptions import CheckDbConnection
-from src.auth.v1.types import UserId, UserRole
+from src.auth.v1.types import UserId, UserRole, RoleId, PermissionId
 from src.auth.v1 import repositories as auth_repositories
 
 logger = logging.getLogger("providers")
 
 
+async def assign_staff_role(
+    session_maker: async_sessionmaker[AsyncSession],
+    redis: Redis,
+    user_id: UserId,
+    role_id: RoleId,
+) -> None:
+    try:
+        async with session_maker.begin() as session:
+            await repositories.create_staff_role(session, user_id, role_id)
+    except Exception as ex:
+        logger.error(ex)
+        raise CheckDbConnection
+    await invalidate_staff_permissions(redis, user_id)
+
+
+async def grant_role_permission(
+    session_maker: async_sessionmaker[AsyncSession],
+    redis: Redis,
+    role_id: RoleId,
+    permission_id: PermissionId,
+) -> None:
+    try:
+        async with session_maker.begin() as session:
+            await repositories.create_role_permission(session, role_id, permission_id)
+            user_ids = await repositories.get_user_ids_by_role(session, role_id)
+    except Exception as ex:
+        logger.error(ex)
+        raise CheckDbConnection
+    # Every staff holding the role gets its bitmap resolved again.
+    await invalidate_staff_permissions(redis, *user_ids)
+
+
 # async def invite_staff(
 #     session_maker: async_sessionmaker[AsyncSession],
 #     provider_id: types.ProviderId,
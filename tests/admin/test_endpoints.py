@@ -1,6 +1,24 @@
+from uuid import uuid4
+
 import pytest
 from httpx import AsyncClient
 
 
-# @pytest.mark.asyncio
-# async def test_
+@pytest.mark.asyncio
+async def test_verify_provider_as_customer(
+    authenticated_client_as_customer: AsyncClient,
+):
+    response = await authenticated_client_as_customer.put(
+        f"/v1/admin/verify-provider/{uuid4()}/"
+    )
+    assert response.status_code == 403
+    assert response.json() == {"detail": "Only admin users can access this resource."}
+
+
+@pytest.mark.asyncio
+async def test_verify_provider_not_found(authenticated_client_as_admin: AsyncClient):
+    response = await authenticated_client_as_admin.put(
+        f"/v1/admin/verify-provider/{uuid4()}/"
+    )
+    assert response.status_code == 404
+    assert response.json() == {"detail": "There is no provider with the provided info."}
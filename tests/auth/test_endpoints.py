@@ -1,16 +1,31 @@
 from uuid import uuid4
 
 import pytest
-from httpx import AsyncClient
+import sqlalchemy as sa
+from httpx import AsyncClient, ASGITransport
 from redis.asyncio import Redis
-
-from src.auth.v1.utils import encode_token
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.main import app
+from src.auth.v1.config import auth_config
+from src.auth.v1.dependencies import identity_filter
+from src.auth.v1.repositories import (
+    get_user_id_by_identity_value,
+    iter_identity_values,
+)
+from src.auth.v1.models import User, UserIdentity
+from src.auth.v1.utils import encode_token, encode_activation_token, pwd_context
 
 from src.auth.v1.types import UserId, UserRole
+from src.notifications.v1.models import NotificationOutbox
+from src.notifications.v1.types import NotificationChannel, NotificationStatus
+from tests.utils import get_authenticated_client
 
 
 @pytest.mark.asyncio
-async def test_register_success(client: AsyncClient, redis_client: Redis):
+async def test_register_success(
+    client: AsyncClient, session_maker_fixture: async_sessionmaker[AsyncSession]
+):
     payload = {
         "identity_type": "email",
         "identity_value": "testuser@example.com",
@@ -28,10 +43,17 @@ async def test_register_success(client: AsyncClient, redis_client: Redis):
     data = response.json()
     assert data["username"] == "testuser"
     assert data["identity_value"] == "testuser@example.com"
-    # Deleting keys from redis memory
-    keys = await redis_client.keys("verification-code:*")
-    if keys:
-        await redis_client.delete(*keys)
+
+    # The activation token is left in the outbox for the notification worker
+    async with session_maker_fixture.begin() as session:
+        notification = await session.scalar(
+            sa.select(NotificationOutbox).where(
+                NotificationOutbox.recipient == "testuser@example.com"
+            )
+        )
+    assert notification is not None
+    assert notification.channel == NotificationChannel.EMAIL
+    assert notification.status == NotificationStatus.PENDING
 
 
 @pytest.mark.asyncio
@@ -88,7 +110,7 @@ async def test_missing_company_name_for_provider(client: AsyncClient):
 
 
 @pytest.mark.asyncio
-async def test_conflict_on_duplicate_identity(client: AsyncClient, redis_client: Redis):
+async def test_conflict_on_duplicate_identity(client: AsyncClient):
     # First registration
     payload = {
         "identity_type": "email",
@@ -111,16 +133,10 @@ async def test_conflict_on_duplicate_identity(client: AsyncClient, redis_client:
         "Email must be unique" in response.text
         or "Phone number must be unique" in response.text
     )
-    # Deleting keys from redis memory
-    keys = await redis_client.keys("verification-code:*")
-    if keys:
-        await redis_client.delete(*keys)
 
 
 @pytest.mark.asyncio
-async def test_conflict_on_duplicate_company_name(
-    client: AsyncClient, redis_client: Redis
-):
+async def test_conflict_on_duplicate_company_name(client: AsyncClient):
     payload = {
         "identity_type": "email",
         "identity_value": "provider1@example.com",
@@ -144,15 +160,10 @@ async def test_conflict_on_duplicate_company_name(
     assert second.status_code == 409
     assert "Company name must be unique" in second.text
 
-    # Deleting keys from redis memory
-    keys = await redis_client.keys("verification-code:*")
-    if keys:
-        await redis_client.delete(*keys)
-
 
 @pytest.mark.asyncio
 async def test_activate_account_success_after_register(
-    client: AsyncClient, redis_client: Redis
+    client: AsyncClient, session_maker_fixture: async_sessionmaker[AsyncSession]
 ):
     # Step 1: Register the user
     payload = {
@@ -170,13 +181,13 @@ async def test_activate_account_success_after_register(
     register_response = await client.post("/v1/auth/register/", json=payload)
     assert register_response.status_code == 201
 
-    # Step 2: Get verification code from Redis
-    keys: list[str] = await redis_client.keys("verification-code:*")
-    assert keys, "No verification code found in Redis"
+    # Step 2: Build the activation token that was sent to the user
+    async with session_maker_fixture.begin() as session:
+        user_id = await get_user_id_by_identity_value(session, "activate@example.com")
+    assert user_id is not None
+    code = encode_activation_token(user_id)
 
-    code = (keys[0].split(":"))[1]
-
-    # Step 3: Activate the account using the retrieved code
+    # Step 3: Activate the account using the token
     response = await client.post(
         "/v1/auth/activate-account/",
         json={"verification_code": code},
@@ -185,15 +196,19 @@ async def test_activate_account_success_after_register(
     assert response.status_code == 200
     assert response.json() == {"detail": "Verified successfully."}
 
+    # Step 4: The token can't be used twice
+    response = await client.post(
+        "/v1/auth/activate-account/",
+        json={"verification_code": code},
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Code might expired or invalid."}
+
 
 @pytest.mark.asyncio
-async def test_activate_account_failure_expired_or_wrong_code(
-    client: AsyncClient, redis_client: Redis
-):
-    fake_code = "123456"
-    await redis_client.delete(
-        f"verification-code:{fake_code}"
-    )  # Ensure it's not in Redis
+async def test_activate_account_failure_expired_or_wrong_code(client: AsyncClient):
+    # Well formed, but not signed with our key
+    fake_code = f"{uuid4().hex}.9999999999.{'A' * 22}"
 
     response = await client.post(
         "/v1/auth/activate-account/",
@@ -206,7 +221,7 @@ async def test_activate_account_failure_expired_or_wrong_code(
 
 @pytest.mark.asyncio
 async def test_activate_account_failure_invalid_format(client: AsyncClient):
-    # Send a code that's not 6 digits
+    # Send a code that's not an activation token
     response = await client.post(
         "/v1/auth/activate-account/",
         json={"verification_code": "abc1234"},
@@ -254,10 +269,13 @@ async def test_resend_verification_code_user_not_found(client: AsyncClient):
 
 
 @pytest.mark.asyncio
-async def test_resend_verification_code_already_activated(client: AsyncClient):
+async def test_resend_verification_code_already_activated(
+    client: AsyncClient, active_customer: tuple[str, str]
+):
+    identity_value, _ = active_customer
     response = await client.post(
         "/v1/auth/verification-code/resend/",
-        json={"identity_value": "activate@example.com"},
+        json={"identity_value": identity_value},
     )
 
     assert response.status_code == 401
@@ -275,11 +293,12 @@ async def test_resend_verification_code_invalid_format(client: AsyncClient):
 
 
 @pytest.mark.asyncio
-async def test_login_success(client: AsyncClient):
+async def test_login_success(client: AsyncClient, active_customer: tuple[str, str]):
+    identity_value, password = active_customer
     # Login with correct credentials
     login_data = {
-        "username": "activate@example.com",  # Using identity_value as username field in OAuth2PasswordRequestForm
-        "password": "strongPass123",
+        "username": identity_value,  # Using identity_value as username field in OAuth2PasswordRequestForm
+        "password": password,
     }
 
     response = await client.post("/v1/auth/login/", data=login_data)
@@ -294,11 +313,14 @@ async def test_login_success(client: AsyncClient):
 
 
 @pytest.mark.asyncio
-async def test_login_invalid_credentials(client: AsyncClient, redis_client: Redis):
-    # Login with correct credentials
+async def test_login_invalid_credentials(
+    client: AsyncClient, active_customer: tuple[str, str]
+):
+    identity_value, password = active_customer
+    # Login with a wrong password
     login_data = {
-        "username": "activate@example.com",  # Using identity_value as username field in OAuth2PasswordRequestForm
-        "password": "strongPass1234",
+        "username": identity_value,  # Using identity_value as username field in OAuth2PasswordRequestForm
+        "password": password + "4",
     }
 
     response = await client.post("/v1/auth/login/", data=login_data)
@@ -306,18 +328,129 @@ async def test_login_invalid_credentials(client: AsyncClient, redis_client: Redi
     assert response.json() == {"detail": "Invalid credentials."}
 
 
+@pytest.mark.asyncio
+async def test_login_rehashes_password_with_configured_cost(
+    client: AsyncClient,
+    user_creator,
+    session_maker_fixture: async_sessionmaker[AsyncSession],
+):
+    identity_value, password = "rehash@example.com", "strongPass123"
+    await user_creator(identity_value, "rehash", "rehash", password, UserRole.CUSTOMER)
+    user_id = sa.select(UserIdentity.user_id).where(
+        UserIdentity.identity_value == identity_value
+    )
+    async with session_maker_fixture.begin() as session:
+        await session.execute(
+            sa.update(User)
+            .values(
+                hashed_password=pwd_context.hash(
+                    password, rounds=auth_config.BCRYPT_ROUNDS + 1
+                )
+            )
+            .where(User.id == user_id.scalar_subquery())
+        )
+
+    response = await client.post(
+        "/v1/auth/login/", data={"username": identity_value, "password": password}
+    )
+    assert response.status_code == 200
+
+    # Background tasks are done once the ASGI transport returns.
+    async with session_maker_fixture() as session:
+        hashed_password = await session.scalar(
+            sa.select(User.hashed_password).where(User.id == user_id.scalar_subquery())
+        )
+    assert hashed_password is not None
+    assert hashed_password.startswith(f"$2b${auth_config.BCRYPT_ROUNDS:02d}$")
+
+
+@pytest.mark.asyncio
+async def test_login_unknown_identity_skips_database(
+    client: AsyncClient,
+    redis_client: Redis,
+    session_maker_fixture: async_sessionmaker[AsyncSession],
+):
+    async with session_maker_fixture() as session:
+        await identity_filter.rebuild(redis_client, iter_identity_values(session, 100))
+    try:
+        definite_misses = identity_filter.definite_misses
+        login_data = {"username": "unknown@example.com", "password": "strongPass123"}
+
+        response = await client.post("/v1/auth/login/", data=login_data)
+        assert response.status_code == 401
+        assert response.json() == {"detail": "Invalid credentials."}
+        assert identity_filter.definite_misses == definite_misses + 1
+    finally:
+        # Users created by other tests bypass the filter.
+        await redis_client.delete(identity_filter.key)
+
+
+@pytest.mark.asyncio
+async def test_register_during_identity_filter_rebuild(
+    client: AsyncClient,
+    redis_client: Redis,
+    session_maker_fixture: async_sessionmaker[AsyncSession],
+):
+    identity_value = "rebuilding@example.com"
+
+    async def batches():
+        async with session_maker_fixture() as session:
+            async for values in iter_identity_values(session, 100):
+                yield values
+        # Committed after the snapshot, while the new bitmap isn't live yet.
+        response = await client.post(
+            "/v1/auth/register/",
+            json={
+                "identity_type": "email",
+                "identity_value": identity_value,
+                "password": "strongPass123",
+                "confirm_password": "strongPass123",
+                "full_name": "Rebuilding",
+                "username": "rebuilding",
+                "avatar": "https://example.com/avatar.jpg",
+            },
+        )
+        assert response.status_code == 201
+
+    try:
+        await identity_filter.rebuild(redis_client, batches())
+        assert await identity_filter.might_contain(redis_client, identity_value)
+    finally:
+        await redis_client.delete(identity_filter.key)
+
+
+@pytest.mark.asyncio
+async def test_login_throttled():
+    login_data = {"username": "throttled@example.com", "password": "strongPass123"}
+    # A client address of its own, so other tests keep their attempts.
+    async with AsyncClient(
+        transport=ASGITransport(app=app, client=("10.0.0.21", 8000)),
+        base_url="http://test",
+    ) as client:
+        for _ in range(auth_config.LOGIN_ATTEMPTS_PER_IDENTITY):
+            response = await client.post("/v1/auth/login/", data=login_data)
+            assert response.status_code == 401
+
+        response = await client.post("/v1/auth/login/", data=login_data)
+        assert response.status_code == 429
+        assert response.json() == {"detail": "Too many login attempts,try again later."}
+        assert int(response.headers["Retry-After"]) > 0
+
+
 @pytest.mark.asyncio
 async def test_refresh_token_success(client: AsyncClient, redis_client: Redis):
-    user_id = "123"
     security_stamp = "stamp123"
+    family, jti = "family123", "jti123"
     old_refresh_token = await encode_token(
         token_type="refresh_token",
         user_id=UserId(uuid4()),
         security_stamp=security_stamp,
         role=UserRole.CUSTOMER,
+        jti=jti,
+        family=family,
     )
 
-    await redis_client.set(old_refresh_token, user_id)
+    await redis_client.set(f"refresh-token:{family}", jti)
 
     response = await client.post(
         "/v1/auth/refresh-token/",
@@ -331,6 +464,41 @@ async def test_refresh_token_success(client: AsyncClient, redis_client: Redis):
     assert await redis_client.get(data["access_token"]) is None
 
 
+@pytest.mark.asyncio
+async def test_refresh_token_reuse_revokes_family(
+    client: AsyncClient, redis_client: Redis
+):
+    family, jti = "family456", "jti456"
+    old_refresh_token = await encode_token(
+        token_type="refresh_token",
+        user_id=UserId(uuid4()),
+        security_stamp="stamp456",
+        role=UserRole.CUSTOMER,
+        jti=jti,
+        family=family,
+    )
+    await redis_client.set(f"refresh-token:{family}", jti)
+
+    response = await client.post(
+        "/v1/auth/refresh-token/", cookies={"refresh_token": old_refresh_token}
+    )
+    assert response.status_code == 200
+    new_refresh_token = response.cookies.get("refresh_token")
+    assert new_refresh_token is not None
+
+    # Replaying the rotated-out token revokes the whole family.
+    response = await client.post(
+        "/v1/auth/refresh-token/", cookies={"refresh_token": old_refresh_token}
+    )
+    assert response.status_code == 401
+    assert await redis_client.get(f"refresh-token:{family}") is None
+
+    response = await client.post(
+        "/v1/auth/refresh-token/", cookies={"refresh_token": new_refresh_token}
+    )
+    assert response.status_code == 401
+
+
 @pytest.mark.asyncio
 async def test_refresh_token_missing_cookie(client: AsyncClient):
     client.cookies.clear()
@@ -339,6 +507,14 @@ async def test_refresh_token_missing_cookie(client: AsyncClient):
     assert response.json()["detail"] == "Token is invalid."
 
 
+@pytest.mark.asyncio
+async def test_logout_missing_cookie(client: AsyncClient):
+    client.cookies.clear()
+    response = await client.get("/v1/auth/logout/")
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token is invalid."
+
+
 @pytest.mark.asyncio
 async def test_refresh_token_invalid(client: AsyncClient):
     fake_token = await encode_token(
@@ -356,9 +532,12 @@ async def test_refresh_token_invalid(client: AsyncClient):
 
 
 @pytest.mark.asyncio
-async def test_reset_password_success(client: AsyncClient):
+async def test_reset_password_success(
+    client: AsyncClient, active_customer: tuple[str, str]
+):
+    identity_value, _ = active_customer
     response = await client.put(
-        "/v1/auth/reset-password/", json={"identity_value": "activate@example.com"}
+        "/v1/auth/reset-password/", json={"identity_value": identity_value}
     )
     assert response.status_code == 204
 
@@ -404,16 +583,74 @@ async def test_change_password_passwords_dont_match(
 
 
 @pytest.mark.asyncio
-async def test_change_password_success(
-    authenticated_client_as_customer: AsyncClient,
-):
+async def test_change_password_success(active_customer: tuple[str, str]):
+    # Not the shared customer client: changing the password revokes its session.
+    identity_value, password = active_customer
+    client = await get_authenticated_client(identity_value, password)
     payload = {
-        "old_password": "12345678",
+        "old_password": password,
         "new_password": "123456789",
         "confirm_password": "123456789",
     }
-    response = await authenticated_client_as_customer.put(
-        "/v1/auth/change-password/", json=payload
-    )
+    response = await client.put("/v1/auth/change-password/", json=payload)
     assert response.status_code == 200
     assert "access_token" in response.text
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_change_password_revokes_previous_access_token(user_creator):
+    identity_value = "revoked@gmail.com"
+    password = "12345678"
+    await user_creator(
+        identity_value, "revoked", "revoked", password, UserRole.CUSTOMER
+    )
+    client = await get_authenticated_client(identity_value, password)
+    payload = {
+        "old_password": password,
+        "new_password": "123456789",
+        "confirm_password": "123456789",
+    }
+    response = await client.put("/v1/auth/change-password/", json=payload)
+    assert response.status_code == 200
+
+    # The client still sends the access token issued before the change.
+    response = await client.put("/v1/auth/change-password/", json=payload)
+    assert response.status_code == 403
+    assert response.json() == {"detail": "Security stamp changed,login again."}
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_jwks_with_hmac_algorithm(client: AsyncClient):
+    response = await client.get("/v1/auth/.well-known/jwks.json")
+    assert response.status_code == 200
+    assert response.json() == {"keys": []}
+    assert response.headers["cache-control"].startswith("public, max-age=")
+
+
+@pytest.mark.asyncio
+async def test_introspect_batch(client: AsyncClient, user_creator):
+    identity_value = "introspected@gmail.com"
+    password = "12345678"
+    await user_creator(
+        identity_value, "introspected", "introspected", password, UserRole.CUSTOMER
+    )
+    authenticated_client = await get_authenticated_client(identity_value, password)
+    access_token = authenticated_client.headers["Authorization"].removeprefix("Bearer ")
+    await authenticated_client.aclose()
+
+    response = await client.post(
+        "/v1/auth/introspect/batch/", json={"tokens": [access_token, "invalid"]}
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0]["active"] is True
+    assert results[0]["role"] == UserRole.CUSTOMER
+    assert results[1] == {
+        "active": False,
+        "user_id": None,
+        "role": None,
+        "exp": None,
+        "detail": "Token is invalid.",
+    }
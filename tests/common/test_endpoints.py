@@ -0,0 +1,38 @@
+import pytest
+from httpx import AsyncClient
+
+from src.auth.v1.config import auth_config
+
+
+@pytest.mark.asyncio
+async def test_stats_requires_internal_api_key(
+    client: AsyncClient, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(auth_config, "INTROSPECTION_API_KEY", "internal-key")
+
+    response = await client.get("/internal/stats/")
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Invalid internal api key."}
+
+    response = await client.get(
+        "/internal/stats/", headers={"X-Internal-Api-Key": "internal-key"}
+    )
+    assert response.status_code == 200
+    assert "password_hasher" in response.json()
+
+
+@pytest.mark.asyncio
+async def test_toggle_loop_monitor_requires_internal_api_key(
+    client: AsyncClient, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(auth_config, "INTROSPECTION_API_KEY", "internal-key")
+
+    response = await client.put("/internal/loop-monitor/?enabled=true")
+    assert response.status_code == 401
+
+    response = await client.put(
+        "/internal/loop-monitor/?enabled=false",
+        headers={"X-Internal-Api-Key": "internal-key"},
+    )
+    assert response.status_code == 200
+    assert response.json()["enabled"] is False
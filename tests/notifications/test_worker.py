@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.notifications.v1.config import notifications_config
+from src.notifications.v1.models import NotificationOutbox
+from src.notifications.v1.repositories import enqueue_notification
+from src.notifications.v1.types import NotificationChannel, NotificationStatus
+from src.notifications.v1.worker import dispatch_batch, purge
+
+
+class RecordingTransport:
+    def __init__(self) -> None:
+        self.sent: list[tuple[NotificationChannel, str, str]] = []
+
+    async def send(
+        self, channel: NotificationChannel, recipient: str, body: str
+    ) -> None:
+        self.sent.append((channel, recipient, body))
+
+
+@pytest.mark.asyncio
+async def test_dispatch_batch_clears_sent_bodies(
+    session_maker_fixture: async_sessionmaker[AsyncSession],
+):
+    async with session_maker_fixture.begin() as session:
+        await enqueue_notification(
+            session, NotificationChannel.EMAIL, "outbox@example.com", "secret"
+        )
+    transport = RecordingTransport()
+
+    assert await dispatch_batch(session_maker_fixture, transport) == 1
+    assert transport.sent == [
+        (NotificationChannel.EMAIL, "outbox@example.com", "secret")
+    ]
+    async with session_maker_fixture.begin() as session:
+        notification = await session.scalar(
+            sa.select(NotificationOutbox).where(
+                NotificationOutbox.recipient == "outbox@example.com"
+            )
+        )
+    assert notification is not None
+    assert notification.status == NotificationStatus.SENT
+    assert notification.body is None
+
+
+@pytest.mark.asyncio
+async def test_purge_deletes_old_settled_notifications(
+    session_maker_fixture: async_sessionmaker[AsyncSession],
+):
+    old = datetime.now(timezone.utc) - timedelta(
+        seconds=notifications_config.NOTIFICATIONS_RETENTION_SEC + 60
+    )
+    async with session_maker_fixture.begin() as session:
+        await session.execute(
+            sa.insert(NotificationOutbox),
+            [
+                {
+                    "channel": NotificationChannel.SMS,
+                    "recipient": f"{status}@example.com",
+                    "body": None if status != NotificationStatus.PENDING else "code",
+                    "status": status,
+                    "created_at": old,
+                }
+                for status in NotificationStatus
+            ],
+        )
+
+    assert await purge(session_maker_fixture) == 2
+    async with session_maker_fixture.begin() as session:
+        statuses = (await session.scalars(sa.select(NotificationOutbox.status))).all()
+    assert statuses == [NotificationStatus.PENDING]
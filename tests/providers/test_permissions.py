@@ -0,0 +1,183 @@
+from uuid import uuid4
+
+import pytest
+import pytest_asyncio
+import sqlalchemy as sa
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.auth.v1.dependencies import TokenPayload
+from src.auth.v1.models import Permission, Role, User, UserIdentity
+from src.auth.v1.types import PermissionId, RoleId, UserId, UserRole
+from src.auth.v1.utils import decode_permission_mask, encode_permission_mask
+from src.providers.v1 import exceptions, services
+from src.providers.v1.dependencies import (
+    get_staff_permissions,
+    permission_mask,
+    requires,
+)
+from src.providers.v1.models import Provider, ProviderStaff
+
+
+async def _user_id(session: AsyncSession, identity_value: str) -> UserId:
+    user_id = await session.scalar(
+        sa.select(UserIdentity.user_id).where(
+            UserIdentity.identity_value == identity_value
+        )
+    )
+    assert user_id is not None
+    return user_id
+
+
+async def _create_permission(session: AsyncSession) -> tuple[PermissionId, str]:
+    # Unique names: the permission id cache outlives the rolled back rows.
+    name = f"manage-products-{uuid4()}"
+    permission_id = await session.scalar(
+        sa.insert(Permission)
+        .values({Permission.name: name, Permission.description: name})
+        .returning(Permission.id)
+    )
+    assert permission_id is not None
+    return permission_id, name
+
+
+@pytest_asyncio.fixture
+async def staff(
+    user_creator, session_maker_fixture: async_sessionmaker[AsyncSession]
+) -> tuple[UserId, RoleId]:
+    """A provider staff holding one role without permissions."""
+    identity_value = f"staff-{uuid4()}@example.com"
+    await user_creator(identity_value, "staff", "staff", "12345678", UserRole.CUSTOMER)
+    async with session_maker_fixture.begin() as session:
+        user_id = await _user_id(session, identity_value)
+        provider_id = await session.scalar(
+            sa.insert(Provider)
+            .values({Provider.name: f"provider-{uuid4()}"})
+            .returning(Provider.id)
+        )
+        await session.execute(
+            sa.insert(ProviderStaff).values(
+                {
+                    ProviderStaff.user_id: user_id,
+                    ProviderStaff.provider_id: provider_id,
+                }
+            )
+        )
+        role_id = await session.scalar(
+            sa.insert(Role)
+            .values(
+                {
+                    Role.name: "staff",
+                    Role.description: "staff",
+                    Role.provider_id: provider_id,
+                }
+            )
+            .returning(Role.id)
+        )
+    assert role_id is not None
+    return user_id, role_id
+
+
+def _token_data(user_id: UserId) -> TokenPayload:
+    return {
+        "exp": 0,
+        "user_id": user_id,
+        "security_stamp": "stamp",
+        "role": UserRole.CUSTOMER,
+    }
+
+
+def test_permission_mask_round_trip():
+    mask = permission_mask([PermissionId(0), PermissionId(3), PermissionId(70)])
+    assert mask == 1 | 1 << 3 | 1 << 70
+    assert decode_permission_mask(encode_permission_mask(mask)) == mask
+    assert decode_permission_mask(encode_permission_mask(0)) == 0
+
+
+@pytest.mark.asyncio
+async def test_requires_grants_permission_of_staff_role(
+    staff: tuple[UserId, RoleId],
+    session_maker_fixture: async_sessionmaker[AsyncSession],
+    redis_client: Redis,
+):
+    user_id, role_id = staff
+    async with session_maker_fixture.begin() as session:
+        permission_id, name = await _create_permission(session)
+    await services.assign_staff_role(
+        session_maker_fixture, redis_client, user_id, role_id
+    )
+    await services.grant_role_permission(
+        session_maker_fixture, redis_client, role_id, permission_id
+    )
+
+    permissions = await requires(name)(
+        _token_data(user_id), session_maker_fixture, redis_client
+    )
+    assert permissions["mask"] == 1 << permission_id
+
+
+@pytest.mark.asyncio
+async def test_requires_denies_missing_permission(
+    staff: tuple[UserId, RoleId],
+    session_maker_fixture: async_sessionmaker[AsyncSession],
+    redis_client: Redis,
+):
+    user_id, _role_id = staff
+    async with session_maker_fixture.begin() as session:
+        _permission_id, name = await _create_permission(session)
+
+    with pytest.raises(exceptions.PermissionDeniedExc):
+        await requires(name)(_token_data(user_id), session_maker_fixture, redis_client)
+
+
+@pytest.mark.asyncio
+async def test_requires_rejects_non_staff_and_caches_it(
+    user_creator,
+    session_maker_fixture: async_sessionmaker[AsyncSession],
+    redis_client: Redis,
+):
+    identity_value = f"customer-{uuid4()}@example.com"
+    await user_creator(identity_value, "cust", "cust", "12345678", UserRole.CUSTOMER)
+    async with session_maker_fixture() as session:
+        user_id = await _user_id(session, identity_value)
+
+    with pytest.raises(exceptions.NotProviderStaffExc):
+        await requires("manage-products")(
+            _token_data(user_id), session_maker_fixture, redis_client
+        )
+    assert await redis_client.get(f"staff-permissions:{user_id}") == "null"
+
+    # Served from the caches once the user is gone from Postgres.
+    async with session_maker_fixture.begin() as session:
+        await session.execute(sa.delete(User).where(User.id == user_id))
+    permissions = await get_staff_permissions(
+        session_maker_fixture, redis_client, user_id
+    )
+    assert permissions is None
+
+
+@pytest.mark.asyncio
+async def test_grant_role_permission_invalidates_cached_bitmap(
+    staff: tuple[UserId, RoleId],
+    session_maker_fixture: async_sessionmaker[AsyncSession],
+    redis_client: Redis,
+):
+    user_id, role_id = staff
+    await services.assign_staff_role(
+        session_maker_fixture, redis_client, user_id, role_id
+    )
+    permissions = await get_staff_permissions(
+        session_maker_fixture, redis_client, user_id
+    )
+    assert permissions is not None and permissions["mask"] == 0
+
+    async with session_maker_fixture.begin() as session:
+        permission_id, _name = await _create_permission(session)
+    await services.grant_role_permission(
+        session_maker_fixture, redis_client, role_id, permission_id
+    )
+
+    permissions = await get_staff_permissions(
+        session_maker_fixture, redis_client, user_id
+    )
+    assert permissions is not None and permissions["mask"] == 1 << permission_id